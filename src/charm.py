@@ -4,25 +4,33 @@
 """Dispatch logic for the calico-enterprise networking charm."""
 
 import binascii
+import functools
 import ipaddress
+import json
 import logging
 import os
 import pathlib
-import tempfile
 import time
-from base64 import b64decode
+from base64 import b64decode, b64encode
 from dataclasses import dataclass
-from subprocess import CalledProcessError, check_output
-from typing import Optional, Tuple, cast
+from typing import Dict, List, Mapping, Optional, Tuple, cast
 
+import worker
 import yaml
+from health import HEARTBEAT, ComponentHealth, HealthSnapshot, unit_status
 from jinja2 import Environment, FileSystemLoader
+from kube import KubeClient, KubeUnavailableError
+from lightkube.core.exceptions import ApiError
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.core_v1 import ConfigMap, Namespace, Node, Secret
+from manifest_index import ManifestIndex
+from manifests import submit_group
 from ops.charm import CharmBase
 from ops.framework import StoredState
 from ops.main import main
 from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, StatusBase, WaitingStatus
-from peer import CalicoEnterprisePeer
-from tenacity import retry, stop_after_delay, wait_exponential
+from peer import CNI_KEYS, CalicoEnterprisePeer
+from reconciler import Step, StepIncompleteError, run_steps
 
 VALID_LOG_LEVELS = ["info", "debug", "warning", "error", "critical"]
 
@@ -31,11 +39,44 @@ TIGERA_DISTRO_VERSIONS = {"1.26": "3.16.1", "1.25": "3.15.2"}
 KUBECONFIG_PATH = "/root/.kube/config"
 PLUGINS_PATH = "/usr/local/bin"
 EE_MANIFESTS = pathlib.Path("upstream/ee")
+OPERATOR_FIELD_MANAGER = "calico-enterprise-operator"
+CRD_ESTABLISHED_TIMEOUT = 120
+# What the leader applied, recorded in the peer application databag for its successors
+APPLIED_STATE = (
+    "applied_digests",
+    "operator_digests",
+    "step_digests",
+    "applied_version",
+    "applied_layout",
+    "applied_layout_generation",
+)
+# Seconds the bgp layout must stay unchanged before a burst of peer changes is applied
+LAYOUT_SETTLE_WINDOW = 60
+# Seconds between the leader's full health probes. Each probe finding the deployment
+# healthy and unchanged doubles the interval, up to the snapshot heartbeat; a change or a
+# degradation returns to probing on every update-status.
+PROBE_MIN_INTERVAL = 300
+PROBE_MAX_INTERVAL = HEARTBEAT
+TIGERA_NAMESPACES = ["tigera-operator", "calico-system"]
 
 
 log = logging.getLogger(__name__)
 
 
+def _kube_guard(handler):
+    """Report an unreachable API server in the unit status rather than failing the hook."""
+
+    @functools.wraps(handler)
+    def wrapper(self, event):
+        try:
+            return handler(self, event)
+        except KubeUnavailableError as e:
+            log.error("%s: %s", handler.__name__, e)
+            self.unit.status = WaitingStatus("Kubernetes API unavailable: see debug logs")
+
+    return wrapper
+
+
 @dataclass
 class RegistrySecret:
     """Holds username and password for registry secret."""
@@ -71,6 +112,7 @@ class CalicoEnterpriseCharm(CharmBase):
     def __init__(self, *args):
         super().__init__(*args)
         self.jinja2_environment = Environment(loader=FileSystemLoader("templates/"))
+        self.kube = KubeClient(KUBECONFIG_PATH)
         self.framework.observe(self.on.install, self.on_install)
         self.framework.observe(self.on.config_changed, self.on_config_changed)
         self.framework.observe(self.on.remove, self.on_remove)
@@ -83,9 +125,24 @@ class CalicoEnterpriseCharm(CharmBase):
         self.stored.set_default(tigera_configured=False)
         self.stored.set_default(pod_restart_needed=False)
         self.stored.set_default(tigera_cni_configured=False)
+        self.stored.set_default(applied_digests={})
+        self.stored.set_default(operator_digests={})
+        self.stored.set_default(step_digests={})
+        self.stored.set_default(reconcile_pending=False)
+        self.stored.set_default(applied_layout="")
+        self.stored.set_default(layout_seen="")
+        self.stored.set_default(layout_changed_at=0.0)
+        self.stored.set_default(layout_pending=False)
+        self.stored.set_default(applied_version="")
+        self.stored.set_default(applied_layout_generation=0)
+        self.stored.set_default(probe_interval=0)
+        self.stored.set_default(probe_at=0.0)
 
         self.peers = CalicoEnterprisePeer(self)
-        self.framework.observe(self.peers.on.bgp_parameters_changed, self.on_config_changed)
+        self.framework.observe(
+            self.peers.on.bgp_parameters_changed, self.on_bgp_parameters_changed
+        )
+        self.framework.observe(self.peers.on.cni_data_changed, self.on_config_changed)
 
         # try:
         #     self.CTL = getContainerRuntimeCtl()
@@ -97,20 +154,6 @@ class CalicoEnterpriseCharm(CharmBase):
     ### Support Methods ###
     #######################
 
-    @retry(reraise=True, stop=stop_after_delay(180), wait=wait_exponential())
-    def kubectl(self, *args):
-        """Run a kubectl cli command with a config file.
-
-        Returns stdout or raises an error if the command fails.
-        """
-        # Retry this command for up to three minutes. The lifecycle of this charm is managed
-        # independently of our k8s api server; this means the k8s control plane may be doing
-        # something else (like restarting) when we invoke kubectl. Account for this with a
-        # sensible retry.
-        cmd = ["kubectl", "--kubeconfig", KUBECONFIG_PATH] + list(args)
-        log.info("Executing {}".format(cmd))
-        return check_output(cmd).decode("utf-8")
-
     def is_kubeconfig_available(self):
         """Check if CNI relation exists and if kubeconfig is available."""
         for relation in self.model.relations["cni"]:
@@ -128,20 +171,24 @@ class CalicoEnterpriseCharm(CharmBase):
         return self.model.config["image_registry"]
 
     def cni_to_calico_enterprise(self, event):
-        """Repeat received CNI relation data to each calico-enterprise unit.
+        """Share received CNI relation data with each calico-enterprise unit.
 
         CNI relation data is received over the cni relation only from
-        kubernetes-control-plane units. The calico-enterprise peer relation
-        shares the value around to each  unit.
+        kubernetes-control-plane units. The leader publishes it once in the
+        calico-enterprise application databag. Other units keep it in their own
+        databag, written only when it changes, for the leader to collect.
         """
         log.debug("Sending CNI data over relation")
-        for key in ["service-cidr", "image-registry"]:
-            cni_data = event.relation.data[event.unit].get(key)
-            log.debug("CNI data: %s", cni_data)
-            if not cni_data:
-                continue
-            for relation in self.model.relations["calico-enterprise"]:
-                relation.data[self.unit][key] = cni_data
+        values = {key: event.relation.data[event.unit].get(key) for key in CNI_KEYS}
+        log.debug("CNI data: %s", values)
+        if self.unit.is_leader():
+            self.peers.publish_cni_data(values)
+            return
+        for relation in self.model.relations["calico-enterprise"]:
+            data = relation.data[self.unit]
+            for key, value in values.items():
+                if value and data.get(key) != value:
+                    data[key] = value
 
     def configure_cni_relation(self):
         """Get."""
@@ -152,11 +199,10 @@ class CalicoEnterpriseCharm(CharmBase):
             relation.data[self.unit]["cni-conf-file"] = "10-calico.conflist"
         self.stored.tigera_cni_configured = True
 
-    def render_template(self, template_file, destination, **kwargs):
-        """Render template_file to destination using kwargs."""
+    def render_template(self, template_file, **kwargs):
+        """Render template_file into a list of objects using kwargs."""
         template = self.jinja2_environment.get_template(template_file)
-        template.stream(**kwargs).dump(destination)
-        return destination
+        return self.kube.load_objects(template.render(**kwargs))
 
     def get_ip_range(self, n):
         """Return the # of bits that compose its range from an IPAddress."""
@@ -177,6 +223,21 @@ class CalicoEnterpriseCharm(CharmBase):
             return None, "Registry secret isn't formatted as <user>:<password>"
         return RegistrySecret(*split), ""
 
+    def image_pull_secret(self, secret: RegistrySecret) -> Secret:
+        """Build the docker-registry secret used to pull the tigera images."""
+        server = self.model.config["image_registry"]
+        auth = b64encode(f"{secret.username}:{secret.password}".encode()).decode()
+        docker_config = {
+            "auths": {
+                server: {"username": secret.username, "password": secret.password, "auth": auth}
+            }
+        }
+        return Secret(
+            metadata=ObjectMeta(name="tigera-pull-secret", namespace="tigera-operator"),
+            type="kubernetes.io/dockerconfigjson",
+            data={".dockerconfigjson": b64encode(json.dumps(docker_config).encode()).decode()},
+        )
+
     #######################
     ### Tigera  Methods ###
     #######################
@@ -233,11 +294,15 @@ class CalicoEnterpriseCharm(CharmBase):
         return True
 
     @property
-    def kubernetes_version(self):
-        """Returns the k8s version."""
-        return ".".join(
-            self.kubectl("version", "--short").split("Server Version: v")[1].split(".")[:2]
-        )
+    def nic_autodetection(self) -> Optional[str]:
+        """Node address autodetection method of the Installation, from the nic_* config."""
+        if self.model.config["nic_autodetection_regex"]:
+            if self.model.config["nic_autodetection_skip_interface"]:
+                return f"skipIterface: ${self.model.config['nic_autodetection_regex']}"
+            return f"interface: {self.model.config['nic_autodetection_regex']}"
+        if self.model.config["nic_autodetection_cidrs"]:
+            return f"cidrs: {self.model.config['nic_autodetection_cidrs'].split(',')}"
+        return None
 
     @property
     def tigera_version(self):
@@ -249,65 +314,80 @@ class CalicoEnterpriseCharm(CharmBase):
         """Load charm tigera manifests based on supported versions in the charm."""
         return EE_MANIFESTS / "manifests" / self.tigera_version
 
-    def apply_tigera_operator(self):
-        """Apply the tigera operator yaml.
+    def background(self, task: str, request: Dict) -> Dict:
+        """Hand a task to the background worker, returning its result once complete.
 
-        Raises: TigeraCalicoError if tigera distro version is not found
+        Raises StepIncompleteError, reporting the worker's progress, until then. A task
+        which failed or stopped is launched again, reporting why it failed.
         """
-        if not pathlib.Path(KUBECONFIG_PATH).exists():
-            self.unit.status = BlockedStatus("Waiting for Kubeconfig to become available")
-            return False
-
-        installation_manifest = self.manifests / "tigera-operator.yaml"
-        try:
-            self.kubectl("create", "-f", installation_manifest)
-        except CalledProcessError:
-            log.warning("Installation manifests failed - tigera operator may be incomplete.")
-
-        crds_manifest = self.manifests / "custom-resources.yaml"
-        try:
-            self.kubectl("create", "-f", crds_manifest)
-        except CalledProcessError:
-            log.warning("CRD manifests failed - tigera operator may be incomplete.")
-
-        # TODO implement a check which checks for tigera resources
-        return True
-
-    def tigera_operator_deployment_status(self) -> StatusBase:
-        """Check if tigera operator is ready.
-
-        returns error in the event of a failed state.
+        status = WaitingStatus(f"Started {task} in the background")
+        job = worker.progress(task)
+        if job and job["request"] == worker.request_digest(request):
+            if job["state"] == worker.DONE:
+                return job["result"]
+            if job["state"] == worker.FAILED:
+                log.warning("Background %s failed: %s", task, job["message"])
+                status = WaitingStatus(f"{task} failed: {job['message']}; retrying")
+            elif worker.is_running(task):
+                raise StepIncompleteError(WaitingStatus(job["message"]))
+            else:
+                log.warning("Background %s stopped: %s", task, job["message"])
+        elif worker.is_running(task):
+            # a superseded request must finish before the unit can be reused
+            raise StepIncompleteError(WaitingStatus(f"Waiting for the previous {task} task"))
+        worker.launch(task, request)
+        raise StepIncompleteError(status)
+
+    def apply_tigera_operator(self, state: Mapping) -> Optional[Dict]:
+        """Server-side apply the tigera operator yaml in the background worker.
+
+        Only objects whose content changed since their last apply, according to the
+        applied state, are sent, each reporting its own outcome. Returns the state to
+        record once every object is applied, raising StepIncompleteError until then.
         """
-        try:
-            output = self.kubectl(
-                "get",
-                "pods",
-                "-l",
-                "k8s-app=tigera-operator",
-                "-n",
-                "tigera-operator",
-                "-o",
-                "jsonpath={.items}",
+        if not pathlib.Path(KUBECONFIG_PATH).exists():
+            raise StepIncompleteError(BlockedStatus("Waiting for Kubeconfig to become available"))
+
+        index = ManifestIndex.load(self.manifests)
+        if state["applied_digests"].get("operator") == index.digest:
+            log.info("Skipping unchanged tigera operator manifests")
+            return None
+
+        result = self.background(
+            "operator",
+            {
+                "kubeconfig": KUBECONFIG_PATH,
+                "manifests": str(self.manifests.resolve()),
+                "applied": state["operator_digests"],
+                "crd_timeout": CRD_ESTABLISHED_TIMEOUT,
+                "field_manager": OPERATOR_FIELD_MANAGER,
+            },
+        )
+        progress = {"operator_digests": result["digests"]}
+        if result["failed"]:
+            raise StepIncompleteError(
+                BlockedStatus(
+                    f"Failed to apply {len(result['failed'])} tigera operator objects: "
+                    "see debug logs"
+                ),
+                progress,
             )
-        except CalledProcessError:
-            log.warning("Kubectl get pods failed - tigera operator may not be deployed.")
-            output = ""
-        pods = yaml.safe_load(output) if output else []
-        if len(pods) == 0:
-            return WaitingStatus("tigera-operator POD not found yet")
-        elif len(pods) > 1:
-            return WaitingStatus(f"Too many tigera-operator PODs (num: {len(pods)})")
-        status = pods[0]["status"]
-        running = status["phase"] == "Running"
-        healthy = all(_["status"] == "True" for _ in status["conditions"])
-        if not running:
-            return WaitingStatus(f"tigera-operator POD not running (phase: {status['phase']})")
-        elif not healthy:
-            failed = ", ".join(_["type"] for _ in status["conditions"] if _["status"] != "True")
-            return WaitingStatus(
-                f"tigera-operator POD conditions not healthy (conditions: {failed})"
+        if result["pending"]:
+            raise StepIncompleteError(
+                WaitingStatus("Waiting for tigera CRDs to be established"), progress
             )
-        return ActiveStatus("Ready")
+
+        if state["applied_version"] != self.tigera_version:
+            log.info(
+                "Applied tigera operator %s, previously %s",
+                self.tigera_version,
+                state["applied_version"] or "none",
+            )
+        return {
+            **progress,
+            "applied_digests": {"operator": result["digest"]},
+            "applied_version": self.tigera_version,
+        }
 
     """
     def pull_cnx_node_image(self):
@@ -327,25 +407,40 @@ class CalicoEnterpriseCharm(CharmBase):
             self.CTL.load(unzipped)
     """
 
-    def check_tigera_status(self):
-        """Check if  tigera operator is ready.
-
-        Returns True if the tigera is ready.
-        """
-        try:
-            output = self.kubectl(
-                "wait",
-                "-n",
-                "tigera-operator",
-                "--for=condition=ready",
-                "pod",
-                "-l",
-                "k8s-app=tigera-operator",
+    def expedite_health_probes(self):
+        """Probe the cluster's health on every update-status until it settles again."""
+        self.stored.probe_interval = 0
+        self.stored.probe_at = 0.0
+
+    def probe_health(self):
+        """Take, publish and report a health snapshot, then schedule the next probe."""
+        snapshot = HealthSnapshot(self.tigera_components(), time.time())
+        status = unit_status(snapshot)
+        if isinstance(status, ActiveStatus) and snapshot.same_health(self.peers.health):
+            interval = cast(int, self.stored.probe_interval) * 2
+            self.stored.probe_interval = min(max(interval, PROBE_MIN_INTERVAL), PROBE_MAX_INTERVAL)
+        else:
+            self.stored.probe_interval = 0
+        self.stored.probe_at = snapshot.taken + cast(int, self.stored.probe_interval)
+        self.peers.publish_health(snapshot)
+        self.unit.status = status
+        if isinstance(status, ActiveStatus):
+            self.app.status = ActiveStatus(self.tigera_version)
+        else:
+            self.app.status = status
+
+    def tigera_components(self) -> Dict[str, ComponentHealth]:
+        """Health of each component, from one list of the TigeraStatus objects."""
+        tigera_status = self.kube.resource("operator.tigera.io/v1", "TigeraStatus")
+        if tigera_status is None:
+            log.warning("TigeraStatus is unknown - tigera operator may not be deployed.")
+            return {}
+        return {
+            status.metadata.name: ComponentHealth.from_conditions(
+                (status.status or {}).get("conditions") or []
             )
-        except CalledProcessError:
-            output = ""
-
-        return True if "met" in output else False
+            for status in self.kube.list(tigera_status)
+        }
 
     def implement_early_network(self):
         """Implement the Early Network.
@@ -365,63 +460,270 @@ class CalicoEnterpriseCharm(CharmBase):
         return not self.is_kubeconfig_available() or not service_cidr or not registry
 
     def pre_tigera_init_config(self):
-        """Create required namespaces and label nodes before creating bgp_layout."""
+        """Check the cluster is ready for the namespaces, node labels and bgp_layout."""
         if not pathlib.Path(KUBECONFIG_PATH).exists():
             self.unit.status = WaitingStatus("Waiting for Kubeconfig to become available")
             return False
         if not self.peers.bgp_layout.nodes:
             self.unit.status = WaitingStatus("Waiting for BGP data from peers")
             return False
+        return True
+
+    def apply_group(self, group: str, objs, applied: Mapping[str, str]) -> Dict:
+        """Apply a group of objects unless it is unchanged since its last apply.
+
+        Returns the group's digest to record in the applied digests.
+        """
+        return {"applied_digests": submit_group(self.kube, group, objs, applied)}
+
+    def apply_namespaces(self, applied: Mapping[str, str]) -> Dict:
+        """Create the namespaces required by the tigera operator."""
+        return self.apply_group(
+            "namespaces",
+            [Namespace(metadata=ObjectMeta(name=_)) for _ in TIGERA_NAMESPACES],
+            applied,
+        )
+
+    def apply_bgp_layout(self, bgp_layout: ConfigMap, applied: Mapping[str, str]) -> Dict:
+        """Publish the bgp-layout config-map to the tigera operator."""
+        bgp_layout.metadata.namespace = "tigera-operator"
+        return self.apply_group("bgp-layout", [bgp_layout], applied)
+
+    def label_nodes(self, racks: Dict[str, str]):
+        """Label each node with its rack.
 
-        self.kubectl("create", "ns", "tigera-operator")
-        self.kubectl("create", "ns", "calico-system")
-        for node in self.peers.bgp_layout.nodes:
-            hostname = node.hostname
+        Raises StepIncompleteError if any node could not be labelled, leaving the reconcile
+        incomplete so update-status retries it until every node is labelled.
+        """
+        unlabelled = []
+        for hostname, rack in racks.items():
             if not hostname:
                 continue
-            rack = node.labels.rack
             try:
-                self.kubectl("label", "node", hostname, f"rack={rack}")
-            except CalledProcessError:
+                self.kube.patch(Node, hostname, {"metadata": {"labels": {"rack": rack}}})
+            except ApiError:
                 log.warning(f"Node labelling failed. Does {hostname} exist?")
-                pass
-
-        with tempfile.NamedTemporaryFile("w") as bgp_layout:
-            yaml.safe_dump(self.peers.bgp_layout_config_map, stream=bgp_layout)
-            self.kubectl("apply", "-n", "tigera-operator", "-f", bgp_layout.name)
-
-        return True
+                unlabelled.append(hostname)
+        if unlabelled:
+            raise StepIncompleteError(
+                WaitingStatus(f"Waiting to label nodes: {', '.join(sorted(unlabelled))}")
+            )
 
     def patch_tigera_install(self):
         """Install Tigera operator."""
         nic_regex = self.model.config["nic_regex"]
-        self.kubectl(
-            "patch",
-            "installations.operator.tigera.io",
+        installation = self.kube.resource("operator.tigera.io/v1", "Installation")
+        self.kube.patch(
+            installation,
             "default",
-            "--type=merge",
-            "-p",
-            '{"spec": {"calicoNetwork": { "nodeAddressAutodetectionV4": {"interface": "%s"}}}}'
-            % nic_regex,
+            {"spec": {"calicoNetwork": {"nodeAddressAutodetectionV4": {"interface": nic_regex}}}},
         )
         return True
 
-    def configure_bgp(self):
-        """Configure BGP according to the charm options."""
-        self.render_template(
+    def render_license(self, config: Mapping):
+        """Render the LicenseKey from the license config."""
+        license = b64decode(config["license"]).rstrip().decode("utf-8")
+        return self.kube.load_objects(license)
+
+    def render_bgp_peers(self, peer_set):
+        """Render a BGPPeer for each unique peer of the cluster."""
+        bgp_peers = self.render_template(
             "bgppeer.yaml.j2",
-            "/tmp/bgppeer.yaml",
-            peer_set=self.peers.bgp_peer_set,
+            peer_set=peer_set,
         )
-        self.kubectl("apply", "-n", "tigera-operator", "-f", "/tmp/bgppeer.yaml")
-        self.render_template(
+        # The bgp-configuration group owns the complete BGPConfiguration
+        return [obj for obj in bgp_peers if obj.kind != "BGPConfiguration"]
+
+    def render_ip_pools(self, config: Mapping):
+        """Render the pod and stable address IPPools."""
+        return self.render_template(
             "ippools.yaml.j2",
-            "/tmp/ippools.yaml",
-            pod_cidr_range=self.model.config["pod_cidr_block_size"],
-            pod_cidr=self.model.config["pod_cidr"],
-            stable_ip_cidr=self.model.config["stable_ip_cidr"],
+            pod_cidr_range=config["pod_cidr_block_size"],
+            pod_cidr=config["pod_cidr"],
+            stable_ip_cidr=config["stable_ip_cidr"],
+        )
+
+    def render_installation(
+        self, secret: RegistrySecret, config: Mapping, nic_autodetection: Optional[str]
+    ):
+        """Render the tigera Installation."""
+        return self.render_template(
+            "calico_enterprise_install.yaml.j2",
+            image_registry=config["image_registry"],
+            image_registry_secret=f"{secret.username}:{secret.password}",
+            image_path=config["image_path"],
+            image_prefix=config["image_prefix"],
+            nic_autodetection=nic_autodetection,
         )
-        self.kubectl("apply", "-n", "tigera-operator", "-f", "/tmp/ippools.yaml")
+
+    def render_bgp_configuration(self, bgp_configuration: Mapping):
+        """Render the cluster's BGPConfiguration."""
+        return self.kube.load_objects(yaml.safe_dump(bgp_configuration))
+
+    def render_addons(self, config: Mapping):
+        """Render the calico enterprise addons."""
+        return self.render_template(
+            "addons.yaml.j2",
+            storage_class=config["addons_storage_class"],
+        )
+
+    def _config(self, *keys: str) -> Dict:
+        return {key: self.model.config[key] for key in keys}
+
+    def tigera_steps(self, secret: RegistrySecret) -> List[Step]:
+        """Declare the steps deploying calico enterprise, their order and their inputs.
+
+        A step only runs when its inputs changed since it last succeeded. The custom
+        resources are rendered once the operator has created their CRDs, each group
+        of them by its own step. Steps run on the reconcile threads, so everything they
+        need from the model or the stored state is read here, on the main thread.
+        """
+        config = dict(self.model.config)
+        state = self.applied_state()
+        applied = state["applied_digests"]
+        racks = {
+            hostname: node.labels.rack
+            for hostname, node in self.peers.bgp_layout.by_hostname.items()
+        }
+        bgp_layout = ConfigMap.from_dict(self.peers.bgp_layout_config_map)
+        peer_set = self.peers.bgp_peer_set
+        registry = self._config("image_registry", "image_registry_secret")
+        pull_secret = self.image_pull_secret(secret) if config["image_registry"] else None
+
+        def _pull_secret():
+            if pull_secret:
+                return self.apply_group("pull-secret", [pull_secret], applied)
+            return None
+
+        def _ready():
+            request = {
+                "kubeconfig": KUBECONFIG_PATH,
+                "timeout": config["operator_ready_timeout"],
+                "rollout": worker.request_digest(rollout),
+            }
+            self.background("ready", request)
+
+        def _custom(group: str, render, inputs: Dict) -> Step:
+            def _apply():
+                return self.apply_group(group, render(), applied)
+
+            return Step(group, _apply, requires=("operator",), inputs=inputs)
+
+        steps = [
+            Step(
+                "namespaces",
+                functools.partial(self.apply_namespaces, applied),
+                inputs={"namespaces": TIGERA_NAMESPACES},
+            ),
+            Step("node-labels", functools.partial(self.label_nodes, racks), inputs=racks),
+            Step(
+                "bgp-layout",
+                functools.partial(self.apply_bgp_layout, bgp_layout, applied),
+                requires=("namespaces",),
+                inputs=bgp_layout.to_dict(),
+            ),
+            Step("pull-secret", _pull_secret, requires=("namespaces",), inputs=registry),
+            Step(
+                "operator",
+                functools.partial(self.apply_tigera_operator, state),
+                requires=("namespaces", "pull-secret"),
+                inputs={"version": self.tigera_version},
+            ),
+            _custom(
+                "license",
+                functools.partial(self.render_license, config),
+                self._config("license"),
+            ),
+            _custom(
+                "bgp-peers",
+                functools.partial(self.render_bgp_peers, peer_set),
+                {"peers": [binding.sort_key for binding in peer_set]},
+            ),
+            _custom(
+                "ip-pools",
+                functools.partial(self.render_ip_pools, config),
+                self._config("pod_cidr", "pod_cidr_block_size", "stable_ip_cidr"),
+            ),
+            _custom(
+                "installation",
+                functools.partial(
+                    self.render_installation, secret, config, self.nic_autodetection
+                ),
+                {
+                    "nic_autodetection": self.nic_autodetection,
+                    **registry,
+                    **self._config("image_path", "image_prefix"),
+                },
+            ),
+            _custom(
+                "bgp-configuration",
+                functools.partial(self.render_bgp_configuration, self.peers.bgp_configuration),
+                {"service_cidr": self.peers.service_cidr},
+            ),
+        ]
+        if config["addons"]:
+            steps.append(
+                _custom(
+                    "addons",
+                    functools.partial(self.render_addons, config),
+                    self._config("addons_storage_class"),
+                )
+            )
+        # Readiness is checked again whenever any other step has work to do
+        rollout = {step.name: step.inputs for step in steps}
+        steps.append(Step("tigera-ready", _ready, requires=tuple(rollout), inputs=rollout))
+        return steps
+
+    def record_step_results(self, results: Mapping[str, Optional[Mapping]]):
+        """Record the state the reconcile steps returned, from the main thread.
+
+        The applied digests of every step are merged; any other value replaces the
+        stored one.
+        """
+        for result in results.values():
+            for key, value in (result or {}).items():
+                if key == "applied_digests":
+                    self.stored.applied_digests.update(value)
+                else:
+                    setattr(self.stored, key, value)
+
+    def steps_status(self, errors: Dict[str, Exception]) -> StatusBase:
+        """Summarise the errors of failed steps into a unit status.
+
+        Unexpected failures block the unit. Otherwise an unreachable API server is raised
+        for _kube_guard to report, before the first incomplete step explains what the unit
+        waits upon.
+        """
+        failed = []
+        for name, error in errors.items():
+            if not isinstance(error, (StepIncompleteError, KubeUnavailableError)):
+                log.error("Step %s failed", name, exc_info=error)
+                failed.append(name)
+        if failed:
+            return BlockedStatus(f"Failed steps {', '.join(failed)}: see debug logs")
+        for error in errors.values():
+            if isinstance(error, KubeUnavailableError):
+                raise error
+        return next(e.status for e in errors.values() if isinstance(e, StepIncompleteError))
+
+    def restore_applied_state(self):
+        """Resume from the state recorded by the last leader, whichever unit that was."""
+        state = self.peers.applied_state
+        for key in APPLIED_STATE:
+            if key in state:
+                setattr(self.stored, key, state[key])
+
+    def applied_state(self) -> Dict:
+        """Copy what this leader applied, to share with future leaders and with steps."""
+        state = {}
+        for key in APPLIED_STATE:
+            value = getattr(self.stored, key)
+            state[key] = dict(value) if isinstance(value, Mapping) else value
+        return state
+
+    def persist_applied_state(self):
+        """Record what this leader applied for any future leader."""
+        self.peers.publish_applied_state(self.applied_state())
 
     def set_active_status(self):
         """Set active if cni is configured."""
@@ -444,16 +746,63 @@ class CalicoEnterpriseCharm(CharmBase):
         if not self.model.config["disable_early_network"]:
             self.implement_early_network()
 
+    def on_bgp_parameters_changed(self, event):
+        """Reconcile a changed bgp layout, coalescing bursts of peer changes.
+
+        The leader skips layouts it already applied. The first change after a quiet
+        period is applied at once; changes following it within LAYOUT_SETTLE_WINDOW
+        are left pending until the layout settles, when update-status applies them.
+        """
+        if not self.unit.is_leader():
+            # Only the leader applies layouts, so nothing stays pending on other units
+            self.stored.layout_pending = False
+            self.on_config_changed(event)
+            return
+
+        fingerprint = self.peers.bgp_layout.fingerprint
+        if fingerprint == self.stored.applied_layout:
+            log.info("Skipping reconcile of the already applied bgp layout")
+            self.stored.layout_pending = False
+            return
+
+        now = time.time()
+        settled = now - self.stored.layout_changed_at >= LAYOUT_SETTLE_WINDOW
+        if fingerprint != self.stored.layout_seen:
+            self.stored.layout_seen = fingerprint
+            self.stored.layout_changed_at = now
+        if not settled:
+            log.info("Deferring reconcile of the bgp layout until it settles")
+            self.stored.layout_pending = True
+            return
+
+        self.on_config_changed(event)
+
+    @_kube_guard
     def on_update_status(self, event):
         """Update status.
 
-        Unit must be in a configured state before status updates are made.
+        Unit must be in a configured state before status updates are made; until then the
+        leader retries a reconcile which did not complete. Only the leader probes the
+        cluster, and only when a probe is due; otherwise every unit reports the leader's
+        last health snapshot.
         """
+        if cast(bool, self.stored.layout_pending):
+            log.info("on_update_status: applying the pending bgp layout.")
+            self.on_bgp_parameters_changed(event)
+            return
+
         if not cast(bool, self.stored.tigera_configured):
+            if self.unit.is_leader() and cast(bool, self.stored.reconcile_pending):
+                log.info("on_update_status: retrying the incomplete reconcile.")
+                self.on_config_changed(event)
+                return
             log.info("on_update_status: unit has not been configured yet; skipping status update.")
             return
 
-        self.unit.status = self.tigera_operator_deployment_status()
+        if not self.unit.is_leader() or time.time() < cast(float, self.stored.probe_at):
+            self.unit.status = unit_status(self.peers.health)
+            return
+        self.probe_health()
 
     def on_cni_relation_changed(self, event):
         """Run CNI relation changed hook."""
@@ -470,19 +819,27 @@ class CalicoEnterpriseCharm(CharmBase):
         return
 
     def on_upgrade_charm(self, event):
-        """Run upgrade-charm hook."""
-        return
+        """Run upgrade-charm hook.
+
+        The templates may have changed with the charm, so every step runs again.
+        """
+        self.stored.step_digests = {}
+        self.persist_applied_state()
+        self.expedite_health_probes()
 
-    def on_config_changed(self, event):  # noqa C901, TODO: consider using reconciler
+    @_kube_guard
+    def on_config_changed(self, event):
         """Config changed event processing.
 
         The leader needs to know the BGP information about every node and only the leader should
         apply the changes in the deployment.
         1) Check if the CNI relation exists
         2) Return if not leader
-        3) Apply tigera operator
+        3) Run the tigera deployment steps whose inputs changed, independent steps concurrently
         """
         self.stored.tigera_configured = False
+        self.stored.reconcile_pending = False
+        self.expedite_health_probes()
         if not self.preflight_checks():
             # TODO: Enters a defer loop
             # event.defer()
@@ -501,62 +858,24 @@ class CalicoEnterpriseCharm(CharmBase):
             self.stored.tigera_configured = True
             return
 
+        self.restore_applied_state()
+        try:
+            self.reconcile_tigera()
+        except KubeUnavailableError:
+            # update-status retries once the API server is reachable again
+            self.stored.reconcile_pending = True
+            raise
+        finally:
+            self.persist_applied_state()
+
+    def reconcile_tigera(self):
+        """Deploy calico enterprise from the leader."""
         if not self.pre_tigera_init_config():
             # TODO: Enters a defer loop
             # event.defer()
             return
 
-        self.unit.status = MaintenanceStatus("Configuring image secret")
-        secret, err = self.image_registry_secret()
-        if self.model.config["image_registry"] and secret:
-            try:
-                self.kubectl(
-                    "delete",
-                    "secret",
-                    "tigera-pull-secret",
-                    "-n",
-                    "tigera-operator",
-                )
-            except CalledProcessError:
-                pass
-            self.kubectl(
-                "create",
-                "secret",
-                "docker-registry",
-                "tigera-pull-secret",
-                f"--docker-username={secret.username}",
-                f"--docker-password={secret.password}",
-                f"--docker-server={self.model.config['image_registry']}",
-                "-n",
-                "tigera-operator",
-            )
-
-        self.unit.status = MaintenanceStatus("Applying Tigera Operator")
-        if not self.apply_tigera_operator():
-            # TODO: Enters a defer loop
-            # event.defer()
-            return
-
-        self.unit.status = MaintenanceStatus("Configuring license")
-        with tempfile.NamedTemporaryFile("w") as license:
-            license.write(b64decode(self.model.config["license"]).rstrip().decode("utf-8"))
-            license.flush()
-            self.kubectl("apply", "-f", license.name)
-
-        self.unit.status = MaintenanceStatus("Generating bgp yamls...")
-        self.configure_bgp()
-
-        nic_autodetection = None
-        if self.model.config["nic_autodetection_regex"]:
-            if self.model.config["nic_autodetection_skip_interface"]:
-                nic_autodetection = (
-                    f"skipIterface: ${self.model.config['nic_autodetection_regex']}"
-                )
-            else:
-                nic_autodetection = f"interface: {self.model.config['nic_autodetection_regex']}"
-        elif self.model.config["nic_autodetection_cidrs"]:
-            nic_autodetection = f"cidrs: {self.model.config['nic_autodetection_cidrs'].split(',')}"
-        else:
+        if not self.nic_autodetection:
             self.unit.status = BlockedStatus(
                 "NIC Autodetection settings are required. (nic_autodetection_* settings.)"
             )
@@ -567,41 +886,22 @@ class CalicoEnterpriseCharm(CharmBase):
             self.unit.status = BlockedStatus(err)
             return
 
-        self.render_template(
-            "calico_enterprise_install.yaml.j2",
-            "/tmp/calico_enterprise_install.yaml",
-            image_registry=self.model.config["image_registry"],
-            image_registry_secret=f"{secret.username}:{secret.password}",
-            image_path=self.model.config["image_path"],
-            image_prefix=self.model.config["image_prefix"],
-            nic_autodetection=nic_autodetection,
-        )
-        self.kubectl("apply", "-f", "/tmp/calico_enterprise_install.yaml")
-
-        with tempfile.NamedTemporaryFile("w") as bgp_configuration:
-            yaml.safe_dump(self.peers.bgp_configuration, stream=bgp_configuration)
-            self.kubectl("apply", "-f", bgp_configuration.name)
-
-        if self.model.config["addons"]:
-            self.unit.status = MaintenanceStatus("Applying Addons")
-            self.render_template(
-                "addons.yaml.j2",
-                "/tmp/addons.yaml",
-                addons_storage_class=self.model.config["addons_storage_class"],
-            )
-            self.kubectl("apply", "-f", "-", "/tmp/addons.yaml")
-
-        for i in range(0, 10):
-            self.unit.status = MaintenanceStatus(f"Wait #{i} for the tigera operator...")
-            if self.check_tigera_status():
-                break
-            time.sleep(24)
-        else:
-            self.unit.status = BlockedStatus("Tigera operator deployment failed: see debug logs")
+        self.unit.status = MaintenanceStatus("Applying manifests...")
+        results: Dict[str, Optional[Mapping]] = {}
+        errors = run_steps(self.tigera_steps(secret), self.stored.step_digests, results=results)
+        self.record_step_results(results)
+        if errors:
+            # update-status retries the steps which did not complete
+            self.stored.reconcile_pending = True
+            self.unit.status = self.steps_status(errors)
             return
 
         self.unit.status = ActiveStatus("Node Configured")
         self.stored.tigera_configured = True
+        self.stored.reconcile_pending = False
+        self.stored.applied_layout = self.peers.bgp_layout.fingerprint
+        self.stored.applied_layout_generation = self.peers.bgp_layout_generation
+        self.stored.layout_pending = False
 
 
 if __name__ == "__main__":  # pragma: nocover
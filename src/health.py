@@ -0,0 +1,123 @@
+"""Snapshot of the tigera deployment's health, shared by every unit.
+
+The leader takes the snapshot and publishes it in the peer application databag,
+so the other units render their status from it without contacting the API server.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional
+
+from ops.model import ActiveStatus, StatusBase, WaitingStatus
+
+# An unchanged snapshot is republished after HEARTBEAT seconds, so units can tell a
+# leader which stopped reporting from a cluster which stayed healthy.
+HEARTBEAT = 1800
+STALE_AFTER = 2 * HEARTBEAT
+AVAILABLE, PROGRESSING, DEGRADED, UNKNOWN = "Available", "Progressing", "Degraded", "Unknown"
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a kubernetes RFC 3339 timestamp."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _duration(seconds: float) -> str:
+    """Render seconds in their largest whole unit, such as 12m."""
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit}"
+    return f"{max(int(seconds), 0)}s"
+
+
+@dataclass
+class ComponentHealth:
+    """State of one component reported by a TigeraStatus, and since when."""
+
+    state: str
+    since: Optional[float] = None
+    reason: str = ""
+
+    @classmethod
+    def from_conditions(cls, conditions: List[Mapping]) -> "ComponentHealth":
+        """Summarize TigeraStatus conditions; degraded outranks progressing and available."""
+        current = {c.get("type"): c for c in conditions if c.get("status") == "True"}
+        for state in (DEGRADED, PROGRESSING, AVAILABLE):
+            if condition := current.get(state):
+                return cls(
+                    state,
+                    _timestamp(condition.get("lastTransitionTime")),
+                    condition.get("message") or condition.get("reason") or "",
+                )
+        return cls(UNKNOWN)
+
+    def describe(self, name: str, now: float) -> str:
+        """Describe the component, with its time in state and any reason."""
+        text = name
+        if self.since is not None:
+            text += f" for {_duration(now - self.since)}"
+        if self.reason and self.state != AVAILABLE:
+            text += f" ({self.reason})"
+        return text
+
+
+@dataclass
+class HealthSnapshot:
+    """Health of each component reported by the cluster's TigeraStatus objects."""
+
+    components: Dict[str, ComponentHealth] = field(default_factory=dict)
+    taken: float = field(default_factory=time.time)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was taken."""
+        return time.time() - self.taken
+
+    @property
+    def status(self) -> StatusBase:
+        """Status of the deployment as of the snapshot, listing unavailable components."""
+        if not self.components:
+            return WaitingStatus("Waiting for TigeraStatus components")
+        now = time.time()
+        summary = []
+        for state in (DEGRADED, PROGRESSING, UNKNOWN):
+            described = [
+                health.describe(name, now)
+                for name, health in sorted(self.components.items())
+                if health.state == state
+            ]
+            if described:
+                summary.append(f"{state}: {', '.join(described)}")
+        if summary:
+            return WaitingStatus("; ".join(summary))
+        return ActiveStatus("Ready")
+
+    def same_health(self, other: Optional["HealthSnapshot"]) -> bool:
+        """Whether other reports the same health, whenever it was taken."""
+        return other is not None and other.components == self.components
+
+    def to_json(self) -> str:
+        """Serialize for the peer databag."""
+        return json.dumps(asdict(self), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "HealthSnapshot":
+        """Deserialize from the peer databag."""
+        as_dict = json.loads(raw)
+        components = {
+            name: ComponentHealth(**health) for name, health in as_dict["components"].items()
+        }
+        return cls(components, as_dict["taken"])
+
+
+def unit_status(snapshot: Optional[HealthSnapshot]) -> StatusBase:
+    """Status a unit reports from the leader's snapshot."""
+    if snapshot is None:
+        return WaitingStatus("Waiting for the leader's health snapshot")
+    if snapshot.age > STALE_AFTER:
+        return WaitingStatus(f"Leader's health snapshot is stale ({int(snapshot.age)}s old)")
+    return snapshot.status
@@ -0,0 +1,278 @@
+"""In-process Kubernetes API access for the calico-enterprise charm."""
+
+import functools
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Type
+
+import httpx
+from lightkube import Client, KubeConfig
+from lightkube.codecs import AnyResource, load_all_yaml
+from lightkube.core.exceptions import ApiError, LoadResourceError
+from lightkube.core.resource import Resource
+from lightkube.generic_resource import get_generic_resource, load_in_cluster_generic_resources
+from lightkube.resources.apiextensions_v1 import CustomResourceDefinition
+from lightkube.types import PatchType
+from tenacity import Retrying, retry_if_exception, stop_after_delay, stop_any, wait_exponential
+
+log = logging.getLogger(__name__)
+FIELD_MANAGER = "calico-enterprise"
+
+# The lifecycle of this charm is managed independently of our k8s api server; this means the
+# k8s control plane may be doing something else (like restarting) when we contact it. Calls
+# failing for a transient reason are retried for up to RETRY_WINDOW seconds, but every call of
+# a dispatch shares DISPATCH_BUDGET seconds, and BREAKER_THRESHOLD consecutive failed attempts
+# stop any further calls.
+RETRY_WINDOW = 180
+DISPATCH_BUDGET = 300
+BREAKER_THRESHOLD = 8
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class KubeUnavailableError(Exception):
+    """The API server could not be reached within this dispatch's retry budget."""
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Whether the error is transient and the request worth repeating.
+
+    Connection failures, throttling and server-side errors are transient. Any other API
+    response, such as a conflict, an invalid object or a missing resource, is permanent.
+    """
+    if isinstance(e, ApiError):
+        return e.status.code in RETRYABLE_STATUS
+    return isinstance(e, httpx.TransportError)
+
+
+def _retry(method):
+    """Run an API call under the client's retry policy."""
+
+    @functools.wraps(method)
+    def wrapper(self: "KubeClient", *args, **kwargs):
+        return self.call(method, self, *args, **kwargs)
+
+    return wrapper
+
+
+class KubeClient:
+    """Kubernetes API client shared by every step of a single charm dispatch.
+
+    The underlying HTTPS session is opened lazily on first use and kept alive for the
+    remainder of the dispatch. In-cluster resource discovery happens at most once.
+    The client may be shared by steps running on several threads.
+    """
+
+    def __init__(self, kubeconfig: Path, budget: float = DISPATCH_BUDGET):
+        self.kubeconfig = Path(kubeconfig)
+        self._client: Optional[Client] = None
+        self._discovered = False
+        self._lock = threading.RLock()
+        self._deadline = time.monotonic() + budget
+        self._failures = 0
+
+    @property
+    def tripped(self) -> bool:
+        """Whether the circuit breaker stopped further calls in this dispatch."""
+        return self._failures >= BREAKER_THRESHOLD
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left in this dispatch's budget."""
+        return self._deadline - time.monotonic()
+
+    def _stop(self, _retry_state) -> bool:
+        return self.tripped or self.remaining <= 0
+
+    def _failed_attempt(self, retry_state):
+        self._failures += 1
+        log.warning(
+            "Kubernetes API attempt %d failed: %s",
+            retry_state.attempt_number,
+            retry_state.outcome.exception(),
+        )
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Call fn, retrying transient API failures within the dispatch budget.
+
+        Raises KubeUnavailableError once the breaker trips or the budget is exhausted.
+        Permanent failures are raised unchanged without retrying.
+        """
+        if self._stop(None):
+            raise KubeUnavailableError("Kubernetes API unavailable, stopped further requests")
+        retrying = Retrying(
+            reraise=True,
+            stop=stop_any(stop_after_delay(RETRY_WINDOW), self._stop),
+            wait=wait_exponential(max=10),
+            retry=retry_if_exception(is_retryable),
+            after=self._failed_attempt,
+        )
+        try:
+            result = retrying(fn, *args, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                raise KubeUnavailableError(f"Kubernetes API unavailable: {e}") from e
+            raise
+        self._failures = 0
+        return result
+
+    @property
+    def client(self) -> Client:
+        """Return the pooled lightkube client, creating it on first use."""
+        with self._lock:
+            if self._client is None:
+                config = KubeConfig.from_file(self.kubeconfig)
+                self._client = Client(config=config, field_manager=FIELD_MANAGER)
+        return self._client
+
+    @_retry
+    def discover(self):
+        """Register generic resources for every CRD in the cluster, once per dispatch."""
+        with self._lock:
+            if not self._discovered:
+                load_in_cluster_generic_resources(self.client)
+                self._discovered = True
+
+    def resource(self, api_version: str, kind: str) -> Type[Resource]:
+        """Look up a custom resource type, discovering the cluster's CRDs if unknown."""
+        res = get_generic_resource(api_version, kind)
+        if res is None:
+            self.discover()
+            res = get_generic_resource(api_version, kind)
+        return res
+
+    def load_objects(self, text: str) -> List[AnyResource]:
+        """Parse a multi-document manifest into lightkube objects.
+
+        Kinds unknown to lightkube trigger a single discovery of the cluster's CRDs.
+        """
+        try:
+            return load_all_yaml(text, create_resources_for_crds=True)
+        except LoadResourceError:
+            if self._discovered:
+                raise
+        self.discover()
+        return load_all_yaml(text, create_resources_for_crds=True)
+
+    @_retry
+    def apply(
+        self,
+        obj: AnyResource,
+        namespace: Optional[str] = None,
+        field_manager: Optional[str] = None,
+    ) -> AnyResource:
+        """Server-side apply a single object.
+
+        Server-side apply keeps no last-applied annotation, so objects larger than the
+        annotation size limit (such as the tigera CRDs) apply like any other.
+        """
+        return self.client.apply(obj, namespace=namespace, field_manager=field_manager, force=True)
+
+    def apply_all(self, objs: Iterable[AnyResource], namespace: Optional[str] = None):
+        """Server-side apply each object in order."""
+        for obj in objs:
+            self.apply(obj, namespace=namespace)
+
+    @_retry
+    def patch(
+        self,
+        res: Type[Resource],
+        name: str,
+        obj: Dict,
+        namespace: Optional[str] = None,
+        patch_type: PatchType = PatchType.MERGE,
+    ) -> AnyResource:
+        """Patch a single object by name."""
+        return self.client.patch(res, name, obj, namespace=namespace, patch_type=patch_type)
+
+    @_retry
+    def list(
+        self,
+        res: Type[Resource],
+        namespace: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+    ) -> List[AnyResource]:
+        """List objects of a resource type."""
+        return list(self.client.list(res, namespace=namespace, labels=labels))
+
+    def _watch_events(self, res: Type[Resource], **selectors) -> queue.Queue:
+        """Stream watch events, or the error ending the watch, into a queue.
+
+        lightkube reconnects a closed watch forever, so the stream is consumed on a
+        daemon thread leaving the caller to enforce its own deadline.
+        """
+        events: queue.Queue = queue.Queue()
+
+        def _watch():
+            try:
+                for event in self.client.watch(res, **selectors):
+                    events.put(event)
+            except Exception as e:
+                events.put(e)
+
+        threading.Thread(target=_watch, daemon=True).start()
+        return events
+
+    def _watch_failed(self, e: Exception):
+        if is_retryable(e):
+            self._failures += 1
+            raise KubeUnavailableError(f"Kubernetes API unavailable: {e}") from e
+        raise e
+
+    def wait_for(
+        self,
+        res: Type[Resource],
+        condition: Callable[[List[AnyResource]], bool],
+        timeout: float,
+        namespace: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+        fields: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """Watch the selected objects until condition holds for them.
+
+        The watch begins with the current state of every selected object, so the
+        condition is met as soon as the cluster reaches it. Returns False if the
+        timeout, or the dispatch budget, passes first.
+        """
+        if self._stop(None):
+            raise KubeUnavailableError("Kubernetes API unavailable, stopped further requests")
+        deadline = time.monotonic() + min(timeout, self.remaining)
+        events = self._watch_events(res, namespace=namespace, labels=labels, fields=fields)
+        objs: Dict[str, AnyResource] = {}
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                event = events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if isinstance(event, Exception):
+                self._watch_failed(event)
+            op, obj = event
+            if op == "DELETED":
+                objs.pop(obj.metadata.name, None)
+            else:
+                objs[obj.metadata.name] = obj
+            if condition(list(objs.values())):
+                return True
+        log.info("Timed out waiting for %s", res.__name__)
+        return False
+
+    def wait_for_established(self, names: Iterable[str], timeout: float) -> bool:
+        """Watch CRDs until each named one reports the Established condition."""
+        names = set(names)
+
+        def _established(crds: List[CustomResourceDefinition]) -> bool:
+            established = {
+                crd.metadata.name
+                for crd in crds
+                if crd.status
+                and any(
+                    c.type == "Established" and c.status == "True"
+                    for c in crd.status.conditions or []
+                )
+            }
+            return names <= established
+
+        log.info("Waiting for %d CRDs to be established", len(names))
+        return self.wait_for(CustomResourceDefinition, _established, timeout)
@@ -0,0 +1,169 @@
+"""Index the documents of the shipped tigera manifests.
+
+Each manifest version is indexed by kind, name, namespace, content digest and
+byte range of every document. Hooks can then locate and load single documents
+without parsing a multi-megabyte bundle. The charm build runs this module
+against every shipped version:
+
+    python3 src/manifest_index.py upstream/ee/manifests/*
+
+Only PyYAML is required so it runs with the build host's python.
+"""
+
+import hashlib
+import json
+import logging
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+import yaml
+
+log = logging.getLogger(__name__)
+INDEX_FILE = "index.json"
+MANIFEST_FILES = ("tigera-operator.yaml", "custom-resources.yaml")
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def resource_name(kind: str, name: str, namespace: Optional[str] = None) -> str:
+    """Name a resource for logs, reports and digest records."""
+    if namespace:
+        return f"{kind}/{namespace}/{name}"
+    return f"{kind}/{name}"
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    """Location and identity of one document within a manifest file."""
+
+    file: str
+    offset: int
+    length: int
+    api_version: str
+    kind: str
+    name: str
+    namespace: str
+    digest: str
+
+    @property
+    def key(self) -> str:
+        """Name of the resource defined by this document."""
+        return resource_name(self.kind, self.name, self.namespace)
+
+
+def _documents(data: bytes) -> Iterator[Tuple[int, int]]:
+    """Yield the byte range of each document in a multi-document yaml."""
+    start = offset = 0
+    for line in data.splitlines(keepends=True):
+        if line.startswith(b"---") and not line[3:].strip():
+            if offset > start:
+                yield start, offset
+            start = offset + len(line)
+        offset += len(line)
+    if offset > start:
+        yield start, offset
+
+
+def build_index(root: Path) -> List[IndexEntry]:
+    """Parse each manifest file of a version once, indexing its documents."""
+    entries = []
+    for file in MANIFEST_FILES:
+        data = (root / file).read_bytes()
+        for start, end in _documents(data):
+            chunk = data[start:end]
+            doc = yaml.load(chunk, Loader=_Loader)
+            if not isinstance(doc, dict):
+                # comment-only or empty documents
+                continue
+            metadata = doc.get("metadata") or {}
+            entries.append(
+                IndexEntry(
+                    file=file,
+                    offset=start,
+                    length=end - start,
+                    api_version=doc.get("apiVersion", ""),
+                    kind=doc.get("kind", ""),
+                    name=metadata.get("name", ""),
+                    namespace=metadata.get("namespace") or "",
+                    digest=hashlib.sha256(chunk).hexdigest(),
+                )
+            )
+    return entries
+
+
+def _file_digests(root: Path) -> Dict[str, str]:
+    return {
+        file: hashlib.sha256((root / file).read_bytes()).hexdigest() for file in MANIFEST_FILES
+    }
+
+
+class ManifestIndex:
+    """Document index of one manifest version."""
+
+    def __init__(self, root: Path, entries: List[IndexEntry]):
+        self.root = Path(root)
+        self.entries = entries
+        self._by_key = {entry.key: entry for entry in entries}
+
+    @classmethod
+    def load(cls, root: Path) -> "ManifestIndex":
+        """Load the prebuilt index of a version, indexing at runtime if it is absent or stale."""
+        root = Path(root)
+        path = root / INDEX_FILE
+        if path.exists():
+            raw = json.loads(path.read_text())
+            if raw.get("files") == _file_digests(root):
+                return cls(root, [IndexEntry(**entry) for entry in raw["entries"]])
+            log.warning("Manifest index %s is stale", path)
+        log.info("Indexing manifests in %s", root)
+        return cls(root, build_index(root))
+
+    def write(self) -> Path:
+        """Store the index beside the manifests it describes."""
+        path = self.root / INDEX_FILE
+        raw = {
+            "files": _file_digests(self.root),
+            "entries": [asdict(entry) for entry in self.entries],
+        }
+        path.write_text(json.dumps(raw, indent=1))
+        return path
+
+    @property
+    def digest(self) -> str:
+        """Fingerprint of the whole version, computed from the document digests."""
+        hasher = hashlib.sha256()
+        for entry in self.entries:
+            hasher.update(entry.digest.encode())
+        return hasher.hexdigest()
+
+    @property
+    def digests(self) -> Dict[str, str]:
+        """Content digest of each resource."""
+        return {entry.key: entry.digest for entry in self.entries}
+
+    def get(self, kind: str, name: str, namespace: Optional[str] = None) -> Optional[IndexEntry]:
+        """Find the document defining a resource."""
+        return self._by_key.get(resource_name(kind, name, namespace))
+
+    def changed(self, applied: Mapping[str, str]) -> List[IndexEntry]:
+        """Documents whose digest differs from the applied digests."""
+        return [entry for entry in self.entries if applied.get(entry.key) != entry.digest]
+
+    def read(self, entry: IndexEntry) -> str:
+        """Read the text of a single document."""
+        with (self.root / entry.file).open("rb") as f:
+            f.seek(entry.offset)
+            return f.read(entry.length).decode()
+
+
+def main(args: List[str]) -> int:
+    """Write the index of each manifest version directory given."""
+    for root in args:
+        index = ManifestIndex(Path(root), build_index(Path(root)))
+        print(f"Indexed {len(index.entries)} documents into {index.write()}")
+    return 0
+
+
+if __name__ == "__main__":  # pragma: nocover
+    sys.exit(main(sys.argv[1:]))
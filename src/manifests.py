@@ -0,0 +1,155 @@
+"""Submit the manifests rendered by the charm, skipping those already applied."""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from kube import KubeClient
+from lightkube.codecs import AnyResource
+from lightkube.core.exceptions import ApiError
+from lightkube.generic_resource import GenericGlobalResource, GenericNamespacedResource
+from manifest_index import resource_name
+
+log = logging.getLogger(__name__)
+
+# Objects other objects depend upon are submitted first. Kinds not listed here
+# follow in the order they were rendered.
+APPLY_ORDER = (
+    "Namespace",
+    "CustomResourceDefinition",
+    "ServiceAccount",
+    "ClusterRole",
+    "ClusterRoleBinding",
+    "Role",
+    "RoleBinding",
+    "Secret",
+    "ConfigMap",
+    "LicenseKey",
+    "Installation",
+    "IPPool",
+    "BGPConfiguration",
+    "BGPPeer",
+)
+
+
+def object_name(obj: AnyResource) -> str:
+    """Name an object for logs and reports."""
+    return resource_name(obj.kind, obj.metadata.name, obj.metadata.namespace)
+
+
+def is_custom_resource(obj: AnyResource) -> bool:
+    """Whether the object's kind is defined by a CRD rather than built into kubernetes."""
+    return isinstance(obj, (GenericGlobalResource, GenericNamespacedResource))
+
+
+def digest(objs: Iterable[AnyResource]) -> str:
+    """Fingerprint the content of a list of objects."""
+    hasher = hashlib.sha256()
+    for obj in objs:
+        hasher.update(json.dumps(obj.to_dict(), sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def _rank(obj: AnyResource) -> int:
+    try:
+        return APPLY_ORDER.index(obj.kind)
+    except ValueError:
+        return len(APPLY_ORDER)
+
+
+def submit_group(
+    kube: KubeClient,
+    group: str,
+    objs: Iterable[AnyResource],
+    applied: Optional[Mapping[str, str]] = None,
+) -> Dict[str, str]:
+    """Submit the objects of a group in dependency order, unless the group is unchanged.
+
+    Returns the group's fingerprint if it was submitted, to record in applied.
+    """
+    objs = list(objs)
+    value = digest(objs)
+    if (applied or {}).get(group) == value:
+        log.info("Skipping unchanged %s", group)
+        return {}
+    if objs:
+        log.info("Applying %d objects from %s", len(objs), group)
+        kube.apply_all(sorted(objs, key=_rank))
+    return {group: value}
+
+
+@dataclass
+class ApplyReport:
+    """Per-object outcome of applying a set of objects."""
+
+    applied: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    pending: List[str] = field(default_factory=list)
+    digests: Dict[str, str] = field(default_factory=dict)
+
+
+def apply_changed(
+    kube: KubeClient,
+    objs: Iterable[AnyResource],
+    applied: Optional[Mapping[str, str]] = None,
+    field_manager: Optional[str] = None,
+) -> ApplyReport:
+    """Server-side apply only the objects whose content differs from applied.
+
+    applied maps object names to the digest of their last successful apply.
+    The report's digests hold the digest of every object applied or unchanged.
+    """
+    applied = applied or {}
+    report = ApplyReport()
+    for obj in sorted(objs, key=_rank):
+        name, value = object_name(obj), digest([obj])
+        if applied.get(name) == value:
+            report.unchanged.append(name)
+            report.digests[name] = value
+            continue
+        try:
+            kube.apply(obj, field_manager=field_manager)
+        except ApiError as e:
+            log.warning("Failed to apply %s: %s", name, e.status.message)
+            report.failed[name] = e.status.message
+            continue
+        log.info("Applied %s", name)
+        report.applied.append(name)
+        report.digests[name] = value
+    return report
+
+
+def apply_staged(
+    kube: KubeClient,
+    objs: Iterable[AnyResource],
+    crd_timeout: float,
+    field_manager: Optional[str] = None,
+) -> ApplyReport:
+    """Server-side apply objects, holding back custom resources until their CRDs are ready.
+
+    Custom resources submitted before a new CRD is Established fail with "no matches for
+    kind", so they are only applied once every CRD applied here reports Established.
+    Custom resources left unapplied when crd_timeout passes are reported as pending.
+    """
+    objs = list(objs)
+    custom = [obj for obj in objs if is_custom_resource(obj)]
+    report = apply_changed(
+        kube, [obj for obj in objs if not is_custom_resource(obj)], field_manager=field_manager
+    )
+    crds = [
+        obj.metadata.name
+        for obj in objs
+        if obj.kind == "CustomResourceDefinition" and object_name(obj) in report.applied
+    ]
+    if crds and not kube.wait_for_established(crds, crd_timeout):
+        report.pending = [object_name(obj) for obj in custom]
+        return report
+
+    staged = apply_changed(kube, custom, field_manager=field_manager)
+    report.applied += staged.applied
+    report.failed.update(staged.failed)
+    report.digests.update(staged.digests)
+    return report
@@ -0,0 +1,79 @@
+"""Encode large values for the peer relation databags.
+
+A value no longer than INLINE_LIMIT is stored as is. A longer value is zlib
+compressed, base64 encoded and split into chunks of at most CHUNK_SIZE
+characters, each under its own numbered key. The value's own key then holds a
+header with the checksum of the original value and the number of chunks:
+
+    bgp-layout   = "zlib+base64:<sha256>:2"
+    bgp-layout.0 = "eJzt..."
+    bgp-layout.1 = "...Q=="
+
+Readers decode either form, so values written as plain json by earlier revisions
+of the charm are still understood.
+"""
+
+import base64
+import hashlib
+import logging
+import zlib
+from typing import Mapping, MutableMapping, Optional
+
+log = logging.getLogger(__name__)
+INLINE_LIMIT = 4096
+CHUNK_SIZE = 65536
+HEADER = "zlib+base64:"
+
+
+def _chunk_key(key: str, index: int) -> str:
+    return f"{key}.{index}"
+
+
+def _chunk_count(stored: Optional[str]) -> int:
+    """Count the chunks a stored value refers to."""
+    if not stored or not stored.startswith(HEADER):
+        return 0
+    try:
+        return int(stored.rsplit(":", 1)[1])
+    except ValueError:
+        return 0
+
+
+def write(data: MutableMapping[str, str], key: str, value: str):
+    """Store value under key, chunked once it exceeds INLINE_LIMIT.
+
+    Chunks left over from a longer previous value are removed.
+    """
+    previous = _chunk_count(data.get(key))
+    chunks = []
+    if len(value) > INLINE_LIMIT:
+        encoded = base64.b64encode(zlib.compress(value.encode())).decode()
+        chunks = [encoded[i : i + CHUNK_SIZE] for i in range(0, len(encoded), CHUNK_SIZE)]
+        checksum = hashlib.sha256(value.encode()).hexdigest()
+        value = f"{HEADER}{checksum}:{len(chunks)}"
+    for index, chunk in enumerate(chunks):
+        data[_chunk_key(key, index)] = chunk
+    for index in range(len(chunks), previous):
+        del data[_chunk_key(key, index)]
+    data[key] = value
+
+
+def read(data: Mapping[str, str], key: str) -> Optional[str]:
+    """Read the value stored under key, whether chunked or not.
+
+    A chunked value which is incomplete or fails its checksum reads as None.
+    """
+    stored = data.get(key)
+    if not stored or not stored.startswith(HEADER):
+        return stored
+    checksum = stored[len(HEADER) :].split(":", 1)[0]
+    chunks = [data.get(_chunk_key(key, index)) or "" for index in range(_chunk_count(stored))]
+    try:
+        value = zlib.decompress(base64.b64decode("".join(chunks))).decode()
+    except (ValueError, zlib.error) as e:
+        log.warning("Couldn't decode the chunks of %s: %s", key, e)
+        return None
+    if hashlib.sha256(value.encode()).hexdigest() != checksum:
+        log.warning("Checksum mismatch reading %s", key)
+        return None
+    return value
@@ -1,30 +1,43 @@
 """Define the calico-enterprise peer relation model."""
 
+import hashlib
+import json
 import logging
 import socket
 from ipaddress import ip_address
 from pathlib import Path
 from subprocess import CalledProcessError, check_output
-from typing import List, Mapping, Optional, Set
+from typing import Any, Callable, Dict, List, Mapping, MutableMapping, Optional, Tuple
 
+import payload
 import yaml
+from health import HEARTBEAT, HealthSnapshot
 from ops.charm import CharmBase, EventBase, EventSource
-from ops.framework import Object, ObjectEvents
-from pydantic import BaseModel, Field, ValidationError, validator
+from ops.framework import Object, ObjectEvents, StoredState
+from records import Field, Record, ValidationError, ip_str, list_of, record_of, to_int, to_str
 
 log = logging.getLogger(__name__)
 CALICO_EARLY_SERVICE = Path("/etc/systemd/system/calico-early.service")
-
-
-def _valid_ip(value: str) -> str:
-    assert ip_address(value), "Confirm this is a valid ip-address"
-    return value
+EARLY_NETWORK_CACHE = Path("/var/lib/calico-enterprise/early-network-node.json")
+BGP_PARAMETERS = "bgp-parameters"
+BGP_PARAMETERS_HASH = "bgp-parameters-hash"
+CNI_KEYS = ("service-cidr", "image-registry")
+CNI_VERSION = "cni-version"
+BGP_LAYOUT = "bgp-layout"
+BGP_LAYOUT_HASH = "bgp-layout-hash"
+BGP_LAYOUT_GENERATION = "bgp-layout-generation"
+APPLIED_STATE = "applied-state"
+HEALTH = "health"
 
 
 def _read_file_content(path: Path) -> Optional[str]:
     return path.read_text() if path.exists() else None
 
 
+def _fingerprint(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
 def _localhost_ips() -> List[ip_address]:
     try:
         lo_ifc = yaml.safe_load(check_output(["ip", "--json", "addr", "show", "lo"]))
@@ -39,63 +52,243 @@ def _localhost_ips() -> List[ip_address]:
     ]
 
 
-class BGPPeer(BaseModel):
+class BGPPeer(Record):
     """Represents a host interface's bgp peer info."""
 
-    ip: str = Field(alias="peerIP")
-    asn: int = Field(alias="peerASNumber")
-    _validate_ip = validator("ip", allow_reuse=True)(_valid_ip)
+    __slots__ = ("ip", "asn")
+    fields = (Field("ip", ip_str, "peerIP"), Field("asn", to_int, "peerASNumber"))
 
 
-class BGPPeerBinding(BaseModel):
+class BGPPeerBinding(Record):
     """Represents the binding of the TOR peer nodes."""
 
-    ip: str
-    asn: int
-    rack: str
-    _validate_ip = validator("ip", allow_reuse=True)(_valid_ip)
+    __slots__ = ("ip", "asn", "rack")
+    fields = (Field("ip", ip_str), Field("asn", to_int), Field("rack", to_str))
 
     def __hash__(self):
         """Make this hashable based on values."""
-        return hash((type(self),) + tuple(self.__dict__.values()))
+        return hash((type(self),) + self._values())
+
+    @property
+    def sort_key(self):
+        """Order bindings by rack, then peer."""
+        return (self.rack, self.ip, self.asn)
 
 
-class BGPLabels(BaseModel):
+class BGPLabels(Record):
     """Represents a host's bgp label info."""
 
-    rack: str
+    __slots__ = ("rack",)
+    fields = (Field("rack", to_str),)
 
 
-class StableAddress(BaseModel):
+class StableAddress(Record):
     """Represents a host's stable address."""
 
-    address: str
-    _validate_address = validator("address", allow_reuse=True)(_valid_ip)
+    __slots__ = ("address",)
+    fields = (Field("address", ip_str),)
 
 
-class BGPParameters(BaseModel):
+class BGPParameters(Record):
     """Represents a host's bgp label info."""
 
-    as_number: int = Field(alias="asNumber")
-    interface_addresses: List[str] = Field(alias="interfaceAddresses")
-    labels: BGPLabels
-    peerings: List[BGPPeer]
-    stable_address: StableAddress = Field(alias="stableAddress")
-    hostname: str
+    __slots__ = (
+        "as_number",
+        "interface_addresses",
+        "labels",
+        "peerings",
+        "stable_address",
+        "hostname",
+    )
+    fields = (
+        Field("as_number", to_int, "asNumber"),
+        Field("interface_addresses", list_of(ip_str), "interfaceAddresses"),
+        Field("labels", record_of(BGPLabels)),
+        Field("peerings", list_of(record_of(BGPPeer))),
+        Field("stable_address", record_of(StableAddress), "stableAddress"),
+        Field("hostname", to_str),
+    )
+
+
+class BGPLayout(Record):
+    """Represents the cluster's bgp layout for all nodes.
+
+    Nodes are kept in a canonical order so identical layouts render identically.
+    """
+
+    __slots__ = ("nodes", "_index")
+    fields = (Field("nodes", list_of(record_of(BGPParameters))),)
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self.nodes.sort(key=lambda node: (node.hostname, node.stable_address.address))
+        self._index: Optional[_LayoutIndex] = None
 
-    @validator("interface_addresses")
-    def _each_valid_ip(cls, v):  # noqa: N805
-        return [_valid_ip(_) for _ in v]
+    @property
+    def index(self) -> "_LayoutIndex":
+        """Lookups into the nodes, built on first use."""
+        if self._index is None:
+            self._index = _LayoutIndex(self.nodes)
+        return self._index
 
+    @property
+    def by_hostname(self) -> Mapping[str, BGPParameters]:
+        """Each node by its hostname."""
+        return self.index.by_hostname
 
-class BGPLayout(BaseModel):
-    """Represents the cluster's bgp layout for all nodes."""
+    @property
+    def by_stable_address(self) -> Mapping[str, BGPParameters]:
+        """Each node by its stable address."""
+        return self.index.by_stable_address
 
-    nodes: List[BGPParameters]
+    @property
+    def by_rack(self) -> Mapping[str, List[BGPParameters]]:
+        """The nodes of each rack."""
+        return self.index.by_rack
+
+    @property
+    def by_asn(self) -> Mapping[int, List[BGPParameters]]:
+        """The nodes of each AS number."""
+        return self.index.by_asn
+
+    @property
+    def rack_peers(self) -> Mapping[str, List[BGPPeer]]:
+        """The unique bgp peers of each rack's nodes, sorted by peer."""
+        return self.index.rack_peers
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest of the layout's canonical json."""
+        return hashlib.sha256(self.json(by_alias=True).encode()).hexdigest()
+
+
+class _LayoutIndex:
+    """Secondary indexes over the nodes of a BGPLayout."""
+
+    def __init__(self, nodes: List[BGPParameters]):
+        self.by_hostname: Dict[str, BGPParameters] = {}
+        self.by_stable_address: Dict[str, BGPParameters] = {}
+        self.by_rack: Dict[str, List[BGPParameters]] = {}
+        self.by_asn: Dict[int, List[BGPParameters]] = {}
+        peers: Dict[str, Dict[Tuple[str, int], BGPPeer]] = {}
+        for node in nodes:
+            self.by_hostname[node.hostname] = node
+            self.by_stable_address[node.stable_address.address] = node
+            self.by_rack.setdefault(node.labels.rack, []).append(node)
+            self.by_asn.setdefault(node.as_number, []).append(node)
+            for peer in node.peerings:
+                peers.setdefault(node.labels.rack, {})[(peer.ip, peer.asn)] = peer
+        self.rack_peers: Dict[str, List[BGPPeer]] = {
+            rack: [unique[key] for key in sorted(unique)] for rack, unique in peers.items()
+        }
+
+
+def _skip_node(loader: yaml.SafeLoader):
+    """Consume the events of the next yaml node without constructing it."""
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def _enter_key(loader: yaml.SafeLoader, key: str) -> bool:
+    """Advance to the value of key in the mapping which the next event starts."""
+    if not loader.check_event(yaml.MappingStartEvent):
+        return False
+    loader.get_event()
+    while not loader.check_event(yaml.MappingEndEvent):
+        name = loader.compose_node(None, None)
+        if isinstance(name, yaml.ScalarNode) and name.value == key:
+            return True
+        _skip_node(loader)
+    return False
+
+
+def _mapping_value(node: Optional[yaml.Node], key: str) -> Optional[yaml.Node]:
+    """Find the value of key in a composed mapping, without constructing it."""
+    if not isinstance(node, yaml.MappingNode):
+        return None
+    for name, value in node.value:
+        if isinstance(name, yaml.ScalarNode) and name.value == key:
+            return value
+    return None
+
+
+def _find_early_node(content: str, stable_address: str) -> Optional[Dict]:
+    """Stream spec.nodes of the early network config up to the node with stable_address.
+
+    Only the nodes before the match are composed, and only the match is constructed.
+    """
+    loader = yaml.SafeLoader(content)
+    try:
+        # skip the stream and document start
+        loader.get_event()
+        loader.get_event()
+        if not (_enter_key(loader, "spec") and _enter_key(loader, "nodes")):
+            return None
+        if not loader.check_event(yaml.SequenceStartEvent):
+            return None
+        loader.get_event()
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node = loader.compose_node(None, None)
+            address = _mapping_value(_mapping_value(node, "stableAddress"), "address")
+            if isinstance(address, yaml.ScalarNode) and address.value == stable_address:
+                return loader.construct_document(node)
+        return None
+    except yaml.YAMLError as e:
+        log.warning(f"Couldn't parse the calico early config: {e}")
+        return None
+    finally:
+        loader.dispose()
+
+
+def _early_cache_key(path: Path, stable_address: str) -> Optional[Dict]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return {
+        "path": str(path.resolve()),
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "stable-address": stable_address,
+    }
+
+
+def _cached_early_node(key: Optional[Dict]) -> Optional[Dict]:
+    """Read the early network node cached for the same file and stable address."""
+    if key is None:
+        return None
+    try:
+        cached = json.loads(EARLY_NETWORK_CACHE.read_text())
+    except (OSError, ValueError):
+        return None
+    return cached.get("node") if cached.get("key") == key else None
+
+
+def _cache_early_node(key: Optional[Dict], node: Dict):
+    if key is None:
+        return
+    try:
+        EARLY_NETWORK_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = EARLY_NETWORK_CACHE.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"key": key, "node": node}, default=str))
+        tmp.replace(EARLY_NETWORK_CACHE)
+    except OSError as e:
+        log.warning(f"Couldn't cache the early network node: {e}")
 
 
 def _early_service_cfg() -> Optional[BGPParameters]:
-    """Read calico-early configuration yaml."""
+    """Read calico-early configuration yaml.
+
+    The local node is cached on disk until the yaml file changes, identified by
+    its path, modification time and size.
+    """
     content = _read_file_content(CALICO_EARLY_SERVICE)
 
     if content is None:
@@ -110,68 +303,252 @@ def _early_service_cfg() -> Optional[BGPParameters]:
             yaml_location, *_ = half.split(maxsplit=1)
             break
 
-    content = _read_file_content(Path(yaml_location))
-
-    if not content:
-        log.warning(f"Couldn't find calico early config in {yaml_location}")
-        return None
-
     stable_address = None
     for ip in _localhost_ips():
         if not ip.is_loopback:
             stable_address = ip
 
-    early_cfg = yaml.safe_load(content)
-    try:
-        for node in early_cfg["spec"]["nodes"]:
-            if node["stableAddress"]["address"] == str(stable_address):
-                break
-        else:
-            raise KeyError(f"No node matches {stable_address}")
-    except (TypeError, KeyError):
-        log.warning(f"Config File didn't contain spec.nodes in config={yaml_location}")
-        return None
+    key = _early_cache_key(Path(yaml_location), str(stable_address))
+    node = _cached_early_node(key)
+    if node is None:
+        content = _read_file_content(Path(yaml_location))
+        if not content:
+            log.warning(f"Couldn't find calico early config in {yaml_location}")
+            return None
+        node = _find_early_node(content, str(stable_address))
+        if node is None:
+            log.warning(f"Config File didn't contain spec.nodes in config={yaml_location}")
+            return None
+        _cache_early_node(key, node)
     hostname = socket.gethostname()
 
     return BGPParameters(hostname=hostname, **node)
 
 
+def _early_network_config(layout: BGPLayout) -> Mapping:
+    if not layout.nodes:
+        log.warning("No node map is available yet")
+    # hostname metadata is never reflected in the yaml sent to tigera operator
+    exclude = {"nodes": {"__all__": {"hostname"}}}
+    return {
+        "apiVersion": "crd.projectcalico.org/v1",
+        "kind": "EarlyNetworkConfiguration",
+        "spec": layout.dict(by_alias=True, exclude=exclude),
+    }
+
+
+def _bgp_peer_set(layout: BGPLayout) -> List[BGPPeerBinding]:
+    return [
+        BGPPeerBinding(asn=peer.asn, ip=peer.ip, rack=rack)
+        for rack, peers in sorted(layout.rack_peers.items())
+        for peer in peers
+    ]
+
+
 class BGPParametersEvent(EventBase):
     """Event indicating a unit updated its BGPParams."""
 
 
+class CNIDataEvent(EventBase):
+    """Event indicating the cni data shared over the peer relation changed."""
+
+
 class CalicoEnterprisePeerEvents(ObjectEvents):
     """Publish Peer Relation Events."""
 
     bgp_parameters_changed = EventSource(BGPParametersEvent)
+    cni_data_changed = EventSource(CNIDataEvent)
 
 
 class CalicoEnterprisePeer(Object):
     """Handle Databag among peer CailcoEnterprise units."""
 
     on = CalicoEnterprisePeerEvents()
+    _stored = StoredState()
 
     def __init__(self, parent: CharmBase, endpoint="calico-enterprise"):
         super().__init__(parent, f"relation-{endpoint}")
         self.endpoint = endpoint
+        self._stored.set_default(fingerprints={})
+        self._stored.set_default(layout_hash=None)
+        self._stored.set_default(cni_version=0)
+        # Parsed layouts and the views derived from them, kept for this dispatch
+        self._parsed: Dict[str, BGPParameters] = {}
+        self._memos: Dict[str, Tuple[Any, Any]] = {}
 
         events = parent.on[endpoint]
         self.framework.observe(parent.on.upgrade_charm, self.peer_change)
         self.framework.observe(events.relation_joined, self.peer_change)
         self.framework.observe(events.relation_changed, self.peer_change)
+        self.framework.observe(parent.on.leader_elected, self.leader_elected)
 
     def publish_bgp_parameters(self):
-        """Publish bgp parameters to peer relation."""
+        """Publish bgp parameters to peer relation.
+
+        Any write wakes every peer, so the canonical json and its fingerprint are
+        only written when they differ from the databag.
+        """
         if bgp_parameters := _early_service_cfg():
+            as_json = bgp_parameters.json(by_alias=True, sort_keys=True)
+            fingerprint = _fingerprint(as_json)
             for relation in self.model.relations[self.endpoint]:
-                as_json = bgp_parameters.json(by_alias=True)
-                relation.data[self.model.unit]["bgp-parameters"] = as_json
+                data = relation.data[self.model.unit]
+                if data.get(BGP_PARAMETERS_HASH) == fingerprint:
+                    continue
+                payload.write(data, BGP_PARAMETERS, as_json)
+                data[BGP_PARAMETERS_HASH] = fingerprint
+
+    def unit_fingerprints(self) -> Dict[str, str]:
+        """Fingerprint of the bgp parameters published by each unit, including self.
+
+        Units which publish no fingerprint have their raw parameters hashed instead.
+        """
+        fingerprints = {}
+        for relation in self.model.relations[self.endpoint]:
+            for unit in relation.units | {self.model.unit}:
+                data = relation.data[unit]
+                if fingerprint := data.get(BGP_PARAMETERS_HASH):
+                    fingerprints[unit.name] = fingerprint
+                elif raw := payload.read(data, BGP_PARAMETERS):
+                    fingerprints[unit.name] = _fingerprint(raw)
+        return fingerprints
+
+    @property
+    def _app_data(self) -> Optional[MutableMapping[str, str]]:
+        relation = self.model.get_relation(self.endpoint)
+        return relation.data[self.model.app] if relation else None
+
+    def _app_value(self, key: str) -> Optional[str]:
+        return payload.read(self._app_data, key) if self._app_data is not None else None
+
+    def publish_cni_data(self, values: Mapping[str, Optional[str]]):
+        """Publish the cni data shared by every unit into the application databag.
+
+        Only the leader may write; the cni-version stamp increments with each change.
+        """
+        data = self._app_data
+        if data is None or not self.model.unit.is_leader():
+            return
+        changed = {key: value for key, value in values.items() if value and data.get(key) != value}
+        if not changed:
+            return
+        log.info("Publishing %s", ", ".join(changed))
+        data.update(changed)
+        data[CNI_VERSION] = str(int(data.get(CNI_VERSION) or 0) + 1)
+
+    def publish_missing_cni_data(self):
+        """Publish the cni data the leader lacks from the data the units agree upon.
+
+        Values already published, such as those taken from the cni relation, are never
+        replaced by the units' agreement, which may be stale.
+        """
+        data = self._app_data
+        if data is None or not self.model.unit.is_leader():
+            return
+        missing = [key for key in CNI_KEYS if not data.get(key)]
+        if missing:
+            self.publish_cni_data({key: self.quorum_data(key) for key in missing})
+
+    def publish_bgp_layout(self):
+        """Publish the cluster's merged bgp layout into the application databag.
+
+        Only the leader may write; the generation increments with each change.
+        """
+        data = self._app_data
+        if data is None or not self.model.unit.is_leader():
+            return
+        layout = self._computed_bgp_layout()
+        if data.get(BGP_LAYOUT_HASH) == layout.fingerprint:
+            return
+        generation = self.bgp_layout_generation + 1
+        log.info("Publishing bgp layout generation %d of %d nodes", generation, len(layout.nodes))
+        payload.write(data, BGP_LAYOUT, layout.json(by_alias=True))
+        data[BGP_LAYOUT_HASH] = layout.fingerprint
+        data[BGP_LAYOUT_GENERATION] = str(generation)
+
+    @property
+    def cni_version(self) -> int:
+        """Version of the cni data published by the leader, 0 before any."""
+        return int(self._app_value(CNI_VERSION) or 0)
+
+    @property
+    def bgp_layout_generation(self) -> int:
+        """Generation of the bgp layout published by the leader, 0 before any."""
+        return int(self._app_value(BGP_LAYOUT_GENERATION) or 0)
+
+    @property
+    def applied_state(self) -> Dict:
+        """State the leader recorded of what it applied to the cluster."""
+        raw = self._app_value(APPLIED_STATE)
+        return json.loads(raw) if raw else {}
+
+    def publish_applied_state(self, state: Mapping):
+        """Record what the leader applied so a new leader can resume from it."""
+        data = self._app_data
+        if data is None or not self.model.unit.is_leader():
+            return
+        as_json = json.dumps(state, sort_keys=True)
+        if payload.read(data, APPLIED_STATE) != as_json:
+            payload.write(data, APPLIED_STATE, as_json)
+
+    @property
+    def health(self) -> Optional[HealthSnapshot]:
+        """Health snapshot the leader took of the tigera deployment."""
+        raw = self._app_value(HEALTH)
+        return HealthSnapshot.from_json(raw) if raw else None
+
+    def publish_health(self, snapshot: HealthSnapshot):
+        """Share the leader's health snapshot with every unit.
+
+        Any write wakes every peer, so an unchanged snapshot is only republished
+        once the last one is a HEARTBEAT old.
+        """
+        data = self._app_data
+        if data is None or not self.model.unit.is_leader():
+            return
+        published = self.health
+        if snapshot.same_health(published) and published.age < HEARTBEAT:
+            return
+        payload.write(data, HEALTH, snapshot.to_json())
+
+    def leader_elected(self, event):
+        """Publish the data the units agree upon when taking over as leader."""
+        self.publish_missing_cni_data()
+        self.publish_bgp_layout()
 
     def peer_change(self, event):
-        """Respond to any changes in the peer data."""
+        """Respond to any changes in the peer data.
+
+        The leader compares every unit's bgp parameters, emitting bgp_parameters_changed
+        when some unit's changed. Other units only compare the hash of the layout the
+        leader published, without reading each unit's databag. cni_data_changed is
+        emitted whenever the leader publishes a new cni-version.
+        """
         if len(self._computed_bgp_layout(local_only=True).nodes) == 0:
             log.info(f"Sharing bgp params from {self.model.unit.name}")
             self.publish_bgp_parameters()
+        # Units which received cni data the leader lacks share it in their own databag
+        self.publish_missing_cni_data()
+        if self.cni_version != self._stored.cni_version:
+            log.info("The shared cni data changed")
+            self._stored.cni_version = self.cni_version
+            self.on.cni_data_changed.emit()
+        if not self.model.unit.is_leader():
+            layout_hash = self._app_value(BGP_LAYOUT_HASH)
+            if layout_hash == self._stored.layout_hash:
+                log.info("The leader published no new bgp layout")
+                return
+            self._stored.layout_hash = layout_hash
+            self.on.bgp_parameters_changed.emit()
+            return
+        fingerprints = self.unit_fingerprints()
+        changed = fingerprints != dict(self._stored.fingerprints)
+        if changed or not self._app_value(BGP_LAYOUT_HASH):
+            self.publish_bgp_layout()
+        if not changed:
+            log.info("No unit changed its bgp parameters")
+            return
+        self._stored.fingerprints = fingerprints
         self.on.bgp_parameters_changed.emit()
 
     def quorum_data(self, key: str) -> Optional[str]:
@@ -187,26 +564,69 @@ class CalicoEnterprisePeer(Object):
         filtered = set(filter(bool, joined_data))
         return filtered.pop() if len(filtered) == 1 else None
 
+    def cni_data(self, key: str) -> Optional[str]:
+        """Return the cni data published by the leader.
+
+        Falls back to the agreed data of each unit until the leader has published any.
+        """
+        return self._app_value(key) or self.quorum_data(key)
+
     @property
     def service_cidr(self) -> Optional[str]:
         """Unify the service-cidr from each unit."""
-        return self.quorum_data("service-cidr")
+        return self.cni_data("service-cidr")
+
+    def _memo(self, name: str, key: Any, build: Callable[[], Any]) -> Any:
+        """Return what build returns, reusing it for as long as key is unchanged.
+
+        Memoized values are shared, so callers must not modify them.
+        """
+        memo = self._memos.get(name)
+        if memo is None or not (memo[0] is key or memo[0] == key):
+            memo = self._memos[name] = (key, build())
+        return memo[1]
+
+    def _parse_bgp_parameters(self, data: Mapping[str, str]) -> BGPParameters:
+        """Parse a unit's bgp parameters, once per distinct value.
+
+        The stored value identifies the parameters, as a chunked value's header
+        carries their checksum.
+        """
+        stored = data[BGP_PARAMETERS]
+        if stored not in self._parsed:
+            self._parsed[stored] = BGPParameters.parse_raw(
+                payload.read(data, BGP_PARAMETERS) or ""
+            )
+        return self._parsed[stored]
 
     def _computed_bgp_layout(self, local_only=False) -> BGPLayout:
         """Generate a BGPLayout from the peer relation."""
-        layout = BGPLayout(nodes=[])
+        bags = []
         for relation in self.model.relations[self.endpoint]:
             units = {self.model.unit} if local_only else relation.units | {self.model.unit}
-            for unit in units:
-                raw = relation.data[unit].get("bgp-parameters")
-                if not raw:
-                    continue
-                params = BGPParameters.parse_raw(raw)
-                layout.nodes += [params]
-        return layout
+            bags.extend(relation.data[unit] for unit in units)
+        bags = [data for data in bags if data.get(BGP_PARAMETERS)]
+        return self._memo(
+            f"computed-{local_only}",
+            sorted(data[BGP_PARAMETERS] for data in bags),
+            lambda: BGPLayout(nodes=[self._parse_bgp_parameters(data) for data in bags]),
+        )
+
+    def _published_bgp_layout(self) -> Optional[BGPLayout]:
+        """Read the merged layout the leader published."""
+        stored = self._app_data.get(BGP_LAYOUT) if self._app_data is not None else None
+
+        def _parse():
+            raw = self._app_value(BGP_LAYOUT)
+            return BGPLayout.parse_raw(raw) if raw else None
+
+        return self._memo("published", stored, _parse)
 
     def _config_bgp_layout(self) -> Optional[BGPLayout]:
         raw_config = self.model.config["bgp_parameters"]
+        return self._memo("config", raw_config, lambda: self._parse_config_bgp_layout(raw_config))
+
+    def _parse_config_bgp_layout(self, raw_config: str) -> Optional[BGPLayout]:
         if not raw_config:
             return None
         try:
@@ -219,24 +639,24 @@ class CalicoEnterprisePeer(Object):
 
     @property
     def bgp_layout(self) -> BGPLayout:
-        """Generate BGPLayout from either config or computed values."""
+        """Generate BGPLayout from either config or computed values.
+
+        Units other than the leader read the layout the leader published, if any,
+        rather than every unit's bgp parameters. The layout is only rebuilt when the
+        config or relation data it came from changes.
+        """
         layout: BGPLayout = None
-        if not (layout := self._config_bgp_layout()):
-            layout = self._computed_bgp_layout()
-        return layout
+        if layout := self._config_bgp_layout():
+            return layout
+        if not self.model.unit.is_leader() and (layout := self._published_bgp_layout()):
+            return layout
+        return self._computed_bgp_layout()
 
     @property
     def early_network_config(self) -> Mapping:
         """Generate a full EarlyNetworkConfig for the cluster."""
-        if not self.bgp_layout.nodes:
-            log.warning("No node map is available yet")
-        # hostname metadata is never reflected in the yaml sent to tigera operator
-        exclude = {"nodes": {"__all__": {"hostname"}}}
-        return {
-            "apiVersion": "crd.projectcalico.org/v1",
-            "kind": "EarlyNetworkConfiguration",
-            "spec": self.bgp_layout.dict(by_alias=True, exclude=exclude),
-        }
+        layout = self.bgp_layout
+        return self._memo("early-network-config", layout, lambda: _early_network_config(layout))
 
     @property
     def bgp_configuration(self) -> Mapping:
@@ -256,19 +676,24 @@ class CalicoEnterprisePeer(Object):
     @property
     def bgp_layout_config_map(self) -> Mapping:
         """Generate the bgp-layout config-map for the cluster."""
-        enc = yaml.safe_dump(self.early_network_config)
-        return {
-            "apiVersion": "v1",
-            "kind": "ConfigMap",
-            "metadata": {"name": "bgp-layout"},
-            "data": {"earlyNetworkConfiguration": enc},
-        }
+        early_network_config = self.early_network_config
+        return self._memo(
+            "bgp-layout-config-map",
+            early_network_config,
+            lambda: {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {"name": "bgp-layout"},
+                "data": {
+                    "earlyNetworkConfiguration": yaml.safe_dump(
+                        early_network_config, sort_keys=True
+                    )
+                },
+            },
+        )
 
     @property
-    def bgp_peer_set(self) -> Set[BGPPeerBinding]:
-        """Generate the bgp peers list for the cluster."""
-        return {
-            BGPPeerBinding(asn=peer.asn, ip=peer.ip, rack=node.labels.rack)
-            for node in self.bgp_layout.nodes
-            for peer in node.peerings
-        }
+    def bgp_peer_set(self) -> List[BGPPeerBinding]:
+        """Generate the unique bgp peers of the cluster, sorted by rack and peer."""
+        layout = self.bgp_layout
+        return self._memo("bgp-peer-set", layout, lambda: _bgp_peer_set(layout))
@@ -0,0 +1,154 @@
+"""Run the steps of a reconcile concurrently, respecting their dependencies.
+
+Each step may declare the inputs it depends upon, such as config values or peer
+data. A step whose inputs are unchanged since it last succeeded is not run again.
+Steps run on worker threads, so they return what they achieved rather than
+recording it themselves; the caller records the results from its own thread.
+"""
+
+import hashlib
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ops.model import StatusBase
+
+log = logging.getLogger(__name__)
+WORKERS = 4
+
+
+class StepIncompleteError(Exception):
+    """A step could not finish yet; status explains why.
+
+    result holds what the step achieved before stopping, to record like the result
+    of a step which completed.
+    """
+
+    def __init__(self, status: StatusBase, result: Any = None):
+        self.status = status
+        self.result = result
+        super().__init__(status.message)
+
+
+@dataclass(frozen=True)
+class Step:
+    """A unit of reconcile work, the names of the steps it must follow and its inputs.
+
+    A step without inputs runs every time.
+    """
+
+    name: str
+    run: Callable[[], Any]
+    requires: Tuple[str, ...] = ()
+    inputs: Optional[Mapping[str, Any]] = None
+
+    @property
+    def digest(self) -> Optional[str]:
+        """Fingerprint of the step's inputs."""
+        if self.inputs is None:
+            return None
+        as_json = json.dumps(self.inputs, sort_keys=True, default=str)
+        return hashlib.sha256(as_json.encode()).hexdigest()
+
+
+def _triage(
+    pending: Dict[str, Step], done: Set[str], failed: Set[str], digests: Mapping[str, str]
+) -> List[Step]:
+    """Take the pending steps which are ready to run.
+
+    Steps which can never run, or whose inputs are unchanged, are settled without running.
+    """
+    ready, settled = [], True
+    while settled:
+        settled = False
+        for name, step in list(pending.items()):
+            if failed.intersection(step.requires):
+                log.info("Skipping step %s, a step it requires failed", name)
+                failed.add(name)
+            elif not done.issuperset(step.requires):
+                continue
+            elif step.digest and digests.get(name) == step.digest:
+                log.info("Skipping step %s, its inputs are unchanged", name)
+                done.add(name)
+            else:
+                ready.append(step)
+            del pending[name]
+            settled = True
+    return ready
+
+
+def _result(future: Future) -> Any:
+    """Return what a finished step achieved, whether or not it completed."""
+    error = future.exception()
+    if error is None:
+        return future.result()
+    return error.result if isinstance(error, StepIncompleteError) else None
+
+
+def run_steps(
+    steps: Iterable[Step],
+    digests: Optional[MutableMapping[str, str]] = None,
+    workers: int = WORKERS,
+    results: Optional[MutableMapping[str, Any]] = None,
+) -> Dict[str, Exception]:
+    """Run each stale step once every step it requires has succeeded.
+
+    digests maps step names to the digest of their inputs when they last succeeded,
+    and is updated as steps succeed. A step whose inputs are unchanged is skipped
+    and counts as succeeded. results, if given, receives what each step returned, or
+    the result of the StepIncompleteError it raised. Both are updated from the calling
+    thread.
+
+    Independent steps run in parallel on a pool of at most workers threads. A step
+    whose requirement failed, directly or transitively, is not run at all.
+    Returns the error raised by each failed step, in the order the steps were given.
+    """
+    digests = {} if digests is None else digests
+    results = {} if results is None else results
+    pending = {step.name: step for step in steps}
+    order = list(pending)
+    for step in pending.values():
+        unknown = set(step.requires) - set(pending)
+        if unknown:
+            raise ValueError(f"Step {step.name} requires unknown steps {sorted(unknown)}")
+
+    done: Set[str] = set()
+    failed: Set[str] = set()
+    errors: Dict[str, Exception] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconcile") as pool:
+        running: Dict[Future, Step] = {}
+        while pending or running:
+            for step in _triage(pending, done, failed, digests):
+                running[pool.submit(step.run)] = step
+            if not running:
+                if pending:
+                    raise ValueError(f"Steps {sorted(pending)} have circular requirements")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                error = future.exception()
+                results[step.name] = _result(future)
+                if error is None:
+                    log.debug("Step %s complete", step.name)
+                    done.add(step.name)
+                    if step.digest:
+                        digests[step.name] = step.digest
+                else:
+                    errors[step.name] = error
+                    failed.add(step.name)
+                    digests.pop(step.name, None)
+    return {name: errors[name] for name in order if name in errors}
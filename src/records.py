@@ -0,0 +1,177 @@
+"""Compact records for the data shared over the peer relation.
+
+Records keep their values in __slots__ and validate them once, when built from
+the wire format. Each field may have a camelCase alias, which the json and dict
+renderings use when by_alias is set:
+
+    class StableAddress(Record):
+        __slots__ = ("address",)
+        fields = (Field("address", ip_str),)
+
+Unknown keys are ignored. Invalid json, missing keys and invalid values all raise
+ValidationError.
+"""
+
+import json
+from collections.abc import Mapping
+from ipaddress import ip_address
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+Exclude = Any
+
+
+class ValidationError(ValueError):
+    """Data does not describe a valid record."""
+
+
+class Field(NamedTuple):
+    """A record field, the function validating its values and its wire name."""
+
+    name: str
+    convert: Callable[[Any], Any]
+    alias: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """Name of the field on the wire."""
+        return self.alias or self.name
+
+
+def to_str(value: Any) -> str:
+    """Accept strings, and numbers as their string form."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError("str type expected")
+
+
+def to_int(value: Any) -> int:
+    """Accept integers, and anything int() accepts."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, (str, float, bool)):
+        return int(value)
+    raise TypeError("value is not a valid integer")
+
+
+def ip_str(value: Any) -> str:
+    """Accept a valid ip address, keeping its string form."""
+    value = to_str(value)
+    ip_address(value)
+    return value
+
+
+def list_of(convert: Callable[[Any], Any]) -> Callable[[Any], List]:
+    """Accept a sequence, validating each item."""
+
+    def _list(value: Any) -> List:
+        if not isinstance(value, (list, tuple)):
+            raise TypeError("value is not a valid list")
+        items = []
+        for index, item in enumerate(value):
+            try:
+                items.append(convert(item))
+            except (AssertionError, TypeError, ValueError) as e:
+                raise ValidationError(f"{index} -> {e}") from e
+        return items
+
+    return _list
+
+
+def record_of(cls: Type["Record"]) -> Callable[[Any], "Record"]:
+    """Accept a record of cls, or the mapping of one."""
+
+    def _record(value: Any) -> Record:
+        if isinstance(value, cls):
+            return value
+        return cls.parse_obj(value)
+
+    return _record
+
+
+def _nested(exclude: Exclude, key: Any, item: bool = False) -> Exclude:
+    """Exclusions within key; __all__ applies to every item of a list."""
+    if not exclude or not isinstance(exclude, Mapping):
+        return None
+    nested = exclude.get(key, exclude.get("__all__") if item else None)
+    return nested if isinstance(nested, (Mapping, set, frozenset)) else None
+
+
+def _dump(value: Any, by_alias: bool, exclude: Exclude) -> Any:
+    if isinstance(value, Record):
+        return value.dict(by_alias=by_alias, exclude=exclude)
+    if isinstance(value, list):
+        return [
+            _dump(item, by_alias, _nested(exclude, i, item=True)) for i, item in enumerate(value)
+        ]
+    return value
+
+
+class Record:
+    """Base of records with slotted, validated fields."""
+
+    __slots__ = ()
+    fields: Tuple[Field, ...] = ()
+
+    def __init__(self, **data: Any):
+        for field in self.fields:
+            if field.key not in data:
+                raise ValidationError(f"{type(self).__name__}: {field.key} -> field required")
+            try:
+                value = field.convert(data[field.key])
+            except (AssertionError, TypeError, ValueError) as e:
+                raise ValidationError(f"{type(self).__name__}: {field.key} -> {e}") from e
+            setattr(self, field.name, value)
+
+    @classmethod
+    def parse_obj(cls, obj: Any) -> "Record":
+        """Build a record from its wire mapping."""
+        if not isinstance(obj, Mapping):
+            raise ValidationError(f"{cls.__name__}: expected a mapping, not {type(obj).__name__}")
+        return cls(**{str(key): value for key, value in obj.items()})
+
+    @classmethod
+    def parse_raw(cls, raw: str) -> "Record":
+        """Build a record from its json."""
+        try:
+            obj = json.loads(raw)
+        except ValueError as e:
+            raise ValidationError(f"{cls.__name__}: invalid json: {e}") from e
+        return cls.parse_obj(obj)
+
+    def _values(self) -> Tuple:
+        return tuple(getattr(self, field.name) for field in self.fields)
+
+    def dict(self, by_alias: bool = False, exclude: Exclude = None) -> Dict[str, Any]:
+        """Render as a mapping, without any excluded fields.
+
+        exclude is a set of field names, or a mapping of field names to the exclusions
+        within each, where __all__ applies to every item of a list.
+        """
+        exclude = exclude or {}
+        rendered = {}
+        for field in self.fields:
+            nested = _nested(exclude, field.name)
+            if field.name in exclude and nested is None:
+                continue
+            key = field.key if by_alias else field.name
+            rendered[key] = _dump(getattr(self, field.name), by_alias, nested)
+        return rendered
+
+    def json(self, by_alias: bool = False, exclude: Exclude = None, **dumps_kwargs: Any) -> str:
+        """Render as json."""
+        return json.dumps(self.dict(by_alias=by_alias, exclude=exclude), **dumps_kwargs)
+
+    def __eq__(self, other: Any) -> bool:
+        """Compare records of the same type by value."""
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._values() == other._values()
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        """Render the field values."""
+        values = ", ".join(f"{field.name}={getattr(self, field.name)!r}" for field in self.fields)
+        return f"{type(self).__name__}({values})"
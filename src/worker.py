@@ -0,0 +1,202 @@
+"""Run long tigera deployment tasks outside of juju hooks.
+
+Juju runs one hook at a time on each machine, so minutes spent applying the
+operator or waiting on its rollout would hold up every other charm on the host.
+The leader instead launches a task as a transient systemd unit running:
+
+    python3 src/worker.py <task>
+
+A task reads its request from, and reports its progress and result into, marker
+files which later hooks read to pick the work back up.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional
+
+from kube import KubeClient
+from lightkube.resources.core_v1 import Pod
+from manifest_index import ManifestIndex
+from manifests import apply_staged
+
+log = logging.getLogger(__name__)
+WORKER_DIR = Path("/var/lib/calico-enterprise/worker")
+UNIT_PREFIX = "calico-enterprise-"
+MAX_RUNTIME = 1800
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+Progress = Callable[[str], None]
+
+
+def _pods_ready(pods) -> bool:
+    """Whether there are pods and each is Ready."""
+    return bool(pods) and all(
+        any(c.type == "Ready" and c.status == "True" for c in pod.status.conditions or [])
+        for pod in pods
+    )
+
+
+def _components_available(tigera_statuses) -> bool:
+    """Whether there are TigeraStatus components and each is Available."""
+    return bool(tigera_statuses) and all(
+        any(
+            c.get("type") == "Available" and c.get("status") == "True"
+            for c in (status.status or {}).get("conditions") or []
+        )
+        for status in tigera_statuses
+    )
+
+
+def apply_operator(request: Mapping, progress: Progress) -> Dict:
+    """Server-side apply the tigera operator objects changed since their last apply."""
+    kube = KubeClient(request["kubeconfig"], budget=MAX_RUNTIME)
+    index = ManifestIndex.load(Path(request["manifests"]))
+    stale = index.changed(request["applied"])
+    progress(f"Applying {len(stale)} tigera operator objects")
+    # Only the documents which changed since their last apply are parsed
+    objs = [obj for entry in stale for obj in kube.load_objects(index.read(entry))]
+    report = apply_staged(
+        kube, objs, request["crd_timeout"], field_manager=request["field_manager"]
+    )
+    log.info(
+        "Tigera operator manifests: %d applied, %d unchanged, %d failed, %d pending",
+        len(report.applied),
+        len(index.entries) - len(stale),
+        len(report.failed),
+        len(report.pending),
+    )
+    return {
+        "digest": index.digest,
+        "digests": {
+            key: value
+            for key, value in index.digests.items()
+            if key not in report.failed and key not in report.pending
+        },
+        "failed": report.failed,
+        "pending": report.pending,
+    }
+
+
+def wait_ready(request: Mapping, progress: Progress) -> Dict:
+    """Watch the tigera operator until its pod and the calico TigeraStatus are ready."""
+    kube = KubeClient(request["kubeconfig"], budget=MAX_RUNTIME)
+    deadline = time.monotonic() + request["timeout"]
+    progress("Waiting for the tigera operator...")
+    if not kube.wait_for(
+        Pod,
+        _pods_ready,
+        deadline - time.monotonic(),
+        namespace="tigera-operator",
+        labels={"k8s-app": "tigera-operator"},
+    ):
+        raise TimeoutError("tigera-operator POD was not ready in time")
+    progress("Waiting for the calico TigeraStatus...")
+    tigera_status = kube.resource("operator.tigera.io/v1", "TigeraStatus")
+    if not kube.wait_for(
+        tigera_status,
+        _components_available,
+        deadline - time.monotonic(),
+        fields={"metadata.name": "calico"},
+    ):
+        raise TimeoutError("calico TigeraStatus was not ready in time")
+    return {}
+
+
+TASKS: Dict[str, Callable[[Mapping, Progress], Dict]] = {
+    "operator": apply_operator,
+    "ready": wait_ready,
+}
+
+
+def request_digest(request: Mapping) -> str:
+    """Fingerprint a task request."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def unit_name(task: str) -> str:
+    """Name of the systemd unit running a task."""
+    return f"{UNIT_PREFIX}{task}"
+
+
+def _write(path: Path, data: Mapping):
+    """Replace a marker file atomically so readers never see a partial write."""
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    tmp.replace(path)
+
+
+def report(task: str, request: str, state: str, message: str, result: Optional[Dict] = None):
+    """Record the progress of a task."""
+    _write(
+        WORKER_DIR / f"{task}.json",
+        {
+            "request": request,
+            "state": state,
+            "message": message,
+            "result": result or {},
+            "updated": time.time(),
+        },
+    )
+
+
+def progress(task: str) -> Optional[Dict]:
+    """Read the last recorded progress of a task."""
+    try:
+        return json.loads((WORKER_DIR / f"{task}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def is_running(task: str) -> bool:
+    """Whether the systemd unit of a task is running."""
+    cmd = ["systemctl", "is-active", "--quiet", unit_name(task)]
+    return subprocess.run(cmd, check=False).returncode == 0
+
+
+def launch(task: str, request: Mapping):
+    """Start a task as a transient systemd unit, which systemd stops after MAX_RUNTIME."""
+    WORKER_DIR.mkdir(parents=True, exist_ok=True)
+    _write(WORKER_DIR / f"{task}.request.json", request)
+    report(task, request_digest(request), RUNNING, f"Starting {task}")
+    python_path = os.pathsep.join(
+        str(Path(_).resolve()) for _ in os.environ.get("PYTHONPATH", "").split(os.pathsep) if _
+    )
+    cmd = [
+        "systemd-run",
+        f"--unit={unit_name(task)}",
+        "--collect",
+        f"--property=RuntimeMaxSec={MAX_RUNTIME}",
+        f"--working-directory={Path.cwd()}",
+        f"--setenv=PYTHONPATH={python_path}",
+        sys.executable,
+        str(Path(__file__).resolve()),
+        task,
+    ]
+    log.info("Launching %s", " ".join(cmd))
+    subprocess.check_call(cmd)
+
+
+def main(args: List[str]) -> int:
+    """Run one task, recording its progress and result for the charm."""
+    logging.basicConfig(level=logging.INFO)
+    (task,) = args
+    request = json.loads((WORKER_DIR / f"{task}.request.json").read_text())
+    digest = request_digest(request)
+    try:
+        result = TASKS[task](request, lambda message: report(task, digest, RUNNING, message))
+    except Exception as e:
+        log.exception("%s failed", task)
+        report(task, digest, FAILED, str(e))
+        return 1
+    report(task, digest, DONE, f"Completed {task}", result)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: nocover
+    sys.exit(main(sys.argv[1:]))
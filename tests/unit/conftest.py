@@ -1,24 +1,22 @@
 import unittest.mock as mock
 
 import pytest
-from charm import CalicoEnterpriseCharm
 
 
-def pytest_configure(config):
-    config.addinivalue_line(
-        "markers",
-        "skip_kubectl_mock: mark tests which do not mock out CalicoEnterpriseCharm.kubectl",
-    )
+@pytest.fixture(autouse=True)
+def kube():
+    """Mock out the kubernetes api client."""
+    with mock.patch("charm.KubeClient", autospec=True) as mocked:
+        yield mocked.return_value
 
 
 @pytest.fixture(autouse=True)
-def kubectl(request):
-    """Mock out kubectl."""
-    if "skip_kubectl_mock" in request.keywords:
-        yield CalicoEnterpriseCharm.kubectl
-        return
-    with mock.patch("charm.CalicoEnterpriseCharm.kubectl", autospec=True) as mocked:
-        yield mocked
+def worker_dir(tmp_path):
+    """Keep background worker markers out of the host."""
+    path = tmp_path / "worker"
+    path.mkdir()
+    with mock.patch("worker.WORKER_DIR", path):
+        yield path
 
 
 # @pytest.fixture(autouse=True)
@@ -4,12 +4,22 @@
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
 
+import json
 import unittest.mock as mock
+from base64 import b64decode, b64encode
 
+import charm as charm_module
+import httpx
 import ops.testing
 import pytest
-from charm import CalicoEnterpriseCharm
-from ops.model import BlockedStatus, MaintenanceStatus
+import worker
+import yaml
+from charm import CalicoEnterpriseCharm, RegistrySecret
+from health import DEGRADED, PROGRESSING, UNKNOWN, ComponentHealth
+from kube import KubeUnavailableError
+from lightkube.core.exceptions import ApiError
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+from reconciler import Step, StepIncompleteError, run_steps
 
 DEFAULT_SERVICE_CIDR = "10.152.183.0/24"
 
@@ -109,19 +119,50 @@ def test_launch_initial_hooks(charm):
     assert charm.unit.status == BlockedStatus("BGP configuration is required.")
 
 
-@pytest.mark.skip_kubectl_mock
-@pytest.mark.usefixtures
-@mock.patch("charm.check_output", autospec=True)
-def test_kubectl(mock_check_output, charm):
-    charm.kubectl("arg1", "arg2")
-    mock_check_output.assert_called_with(
-        ["kubectl", "--kubeconfig", "/root/.kube/config", "arg1", "arg2"]
+def test_image_pull_secret(harness, charm):
+    harness.disable_hooks()
+    harness.update_config({"image_registry": "registry.local"})
+    secret = charm.image_pull_secret(RegistrySecret("user", "pass"))
+    assert secret.metadata.name == "tigera-pull-secret"
+    assert secret.metadata.namespace == "tigera-operator"
+    assert secret.type == "kubernetes.io/dockerconfigjson"
+    docker_config = json.loads(b64decode(secret.data[".dockerconfigjson"]))
+    assert docker_config["auths"]["registry.local"] == {
+        "username": "user",
+        "password": "pass",
+        "auth": b64encode(b"user:pass").decode(),
+    }
+
+
+def test_tigera_components(charm, kube):
+    calico = mock.Mock(
+        status={
+            "conditions": [
+                {"type": "Available", "status": "True"},
+                {
+                    "type": "Degraded",
+                    "status": "True",
+                    "message": "Pods not ready: 2/3",
+                    "lastTransitionTime": "2024-01-01T00:00:00Z",
+                },
+            ]
+        }
     )
+    calico.metadata.name = "calico"
+    apiserver = mock.Mock(status=None)
+    apiserver.metadata.name = "apiserver"
+    kube.list.return_value = [calico, apiserver]
+    assert charm.tigera_components() == {
+        "calico": ComponentHealth(DEGRADED, 1704067200.0, "Pods not ready: 2/3"),
+        "apiserver": ComponentHealth(UNKNOWN),
+    }
+    kube.list.assert_called_once_with(kube.resource.return_value)
 
+    kube.resource.return_value = None
+    assert charm.tigera_components() == {}
 
-@pytest.mark.usefixtures
-@mock.patch("jinja2.environment.Template.stream", autospec=True)
-def test_configure_bgp(mock_stream, charm, harness):
+
+def test_configure_bgp(charm, harness, kube):
     config_dict = {
         "stable_ip_cidr": "192.168.1.0/24",
         "pod_cidr": "192.168.10.0/24",
@@ -130,11 +171,16 @@ def test_configure_bgp(mock_stream, charm, harness):
     }
     harness.disable_hooks()
     harness.update_config(config_dict)
-    charm.configure_bgp()
-    _, args, kwargs = mock_stream.mock_calls[0]
-    assert args[0].render(**kwargs) == TEST_CONFIGURE_BGP_BGPPEER_YAML
-    _, args, kwargs = mock_stream.mock_calls[2]
-    assert args[0].render(**kwargs) == TEST_CONFIGURE_BGP_IPPOOLS_YAML
+    kube.load_objects.side_effect = lambda text: [
+        mock.Mock(kind=doc["kind"]) for doc in yaml.safe_load_all(text) if doc
+    ]
+    bgp_peers = charm.render_bgp_peers(charm.peers.bgp_peer_set)
+    ip_pools = charm.render_ip_pools(charm.model.config)
+    bgp_peers_yaml, ip_pools_yaml = (call.args[0] for call in kube.load_objects.call_args_list)
+    assert bgp_peers_yaml == TEST_CONFIGURE_BGP_BGPPEER_YAML
+    assert ip_pools_yaml == TEST_CONFIGURE_BGP_IPPOOLS_YAML
+    assert [obj.kind for obj in bgp_peers] == ["BGPPeer"]
+    assert [obj.kind for obj in ip_pools] == ["IPPool", "IPPool"]
 
 
 def test_is_kubeconfig_available(harness, charm):
@@ -192,3 +238,498 @@ def test_configure_bgp(mock_stream, charm, harness):
         == TEST_CONFIGURE_BGP_IPPOOLS_YAML
     )
 """
+
+
+@pytest.fixture
+def kubeconfig(tmp_path):
+    path = tmp_path / "config"
+    path.write_text("")
+    with mock.patch("charm.KUBECONFIG_PATH", str(path)):
+        yield path
+
+
+@pytest.fixture
+def launch():
+    with mock.patch("worker.launch", autospec=True) as launch:
+        with mock.patch("worker.is_running", autospec=True, return_value=False):
+            yield launch
+
+
+def _finish(launch, result):
+    (task, request), _ = launch.call_args
+    worker.report(task, worker.request_digest(request), worker.DONE, "done", result)
+
+
+def test_background(harness, charm, launch):
+    harness.disable_hooks()
+    with pytest.raises(StepIncompleteError) as exc:
+        charm.background("ready", {"rollout": "abc"})
+    assert exc.value.status == WaitingStatus("Started ready in the background")
+    launch.assert_called_once_with("ready", {"rollout": "abc"})
+
+    launch.reset_mock()
+    worker.report("ready", worker.request_digest({"rollout": "abc"}), worker.RUNNING, "Waiting")
+    with mock.patch("worker.is_running", return_value=True):
+        with pytest.raises(StepIncompleteError) as exc:
+            charm.background("ready", {"rollout": "abc"})
+        assert exc.value.status == WaitingStatus("Waiting")
+        with pytest.raises(StepIncompleteError) as exc:
+            charm.background("ready", {"rollout": "def"})
+        assert exc.value.status == WaitingStatus("Waiting for the previous ready task")
+    launch.assert_not_called()
+
+    # a task which stopped without completing is launched again
+    with pytest.raises(StepIncompleteError):
+        charm.background("ready", {"rollout": "abc"})
+    launch.assert_called_once_with("ready", {"rollout": "abc"})
+
+    # a failed task is launched again, reporting its failure
+    launch.reset_mock()
+    worker.report("ready", worker.request_digest({"rollout": "abc"}), worker.FAILED, "timed out")
+    with pytest.raises(StepIncompleteError) as exc:
+        charm.background("ready", {"rollout": "abc"})
+    assert exc.value.status == WaitingStatus("ready failed: timed out; retrying")
+    launch.assert_called_once_with("ready", {"rollout": "abc"})
+
+    _finish(launch, {"ready": True})
+    assert charm.background("ready", {"rollout": "abc"}) == {"ready": True}
+
+
+def test_apply_tigera_operator_without_kubeconfig(harness, charm, launch):
+    harness.disable_hooks()
+    with pytest.raises(StepIncompleteError) as e:
+        charm.apply_tigera_operator(charm.applied_state())
+    assert e.value.status == BlockedStatus("Waiting for Kubeconfig to become available")
+    launch.assert_not_called()
+
+
+@pytest.mark.usefixtures("kubeconfig")
+def test_apply_tigera_operator_skips_unchanged(harness, charm, launch):
+    harness.disable_hooks()
+    with pytest.raises(StepIncompleteError):
+        charm.apply_tigera_operator(charm.applied_state())
+    (_, request), _ = launch.call_args
+    assert request["applied"] == {}
+    assert request["field_manager"] == "calico-enterprise-operator"
+
+    _finish(
+        launch,
+        {
+            "digest": "abc",
+            "digests": {"Namespace/tigera-operator": "def"},
+            "failed": {},
+            "pending": [],
+        },
+    )
+    result = charm.apply_tigera_operator(charm.applied_state())
+    assert result == {
+        "operator_digests": {"Namespace/tigera-operator": "def"},
+        "applied_digests": {"operator": "abc"},
+        "applied_version": charm.tigera_version,
+    }
+    charm.record_step_results({"operator": result})
+    assert charm.stored.operator_digests == {"Namespace/tigera-operator": "def"}
+    assert charm.stored.applied_digests["operator"] == "abc"
+
+
+@pytest.mark.usefixtures("kubeconfig")
+def test_apply_tigera_operator_failures(harness, charm, launch):
+    harness.disable_hooks()
+    with pytest.raises(StepIncompleteError):
+        charm.apply_tigera_operator(charm.applied_state())
+    _finish(
+        launch,
+        {
+            "digest": "abc",
+            "digests": {"Namespace/tigera-operator": "def"},
+            "failed": {"Deployment/tigera-operator/tigera-operator": "invalid"},
+            "pending": [],
+        },
+    )
+    with pytest.raises(StepIncompleteError) as e:
+        charm.apply_tigera_operator(charm.applied_state())
+    assert e.value.status == BlockedStatus(
+        "Failed to apply 1 tigera operator objects: see debug logs"
+    )
+    assert e.value.result == {"operator_digests": {"Namespace/tigera-operator": "def"}}
+
+
+@pytest.mark.usefixtures("kubeconfig")
+def test_apply_tigera_operator_pending_crds(harness, charm, launch):
+    harness.disable_hooks()
+    with pytest.raises(StepIncompleteError):
+        charm.apply_tigera_operator(charm.applied_state())
+    _finish(
+        launch,
+        {"digest": "abc", "digests": {}, "failed": {}, "pending": ["Installation/default"]},
+    )
+    with pytest.raises(StepIncompleteError) as e:
+        charm.apply_tigera_operator(charm.applied_state())
+    assert e.value.status == WaitingStatus("Waiting for tigera CRDs to be established")
+    assert e.value.result == {"operator_digests": {}}
+
+
+def test_kube_unavailable(harness, charm, kube):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    charm.stored.tigera_configured = True
+    kube.list.side_effect = KubeUnavailableError("Kubernetes API unavailable: refused")
+    charm.on_update_status(None)
+    assert charm.unit.status == WaitingStatus("Kubernetes API unavailable: see debug logs")
+
+
+def test_tigera_steps(harness, charm):
+    harness.disable_hooks()
+    harness.update_config({"bgp_parameters": TEST_CONFIGURE_BGP_INPUT})
+    with mock.patch.object(CalicoEnterpriseCharm, "tigera_version", "3.16.1"):
+        steps = charm.tigera_steps(RegistrySecret("user", "pass"))
+    requires = {step.name: step.requires for step in steps}
+    assert requires["operator"] == ("namespaces", "pull-secret")
+    assert requires["license"] == ("operator",)
+    assert "addons" not in requires
+    assert set(requires["tigera-ready"]) == set(requires) - {"tigera-ready"}
+    assert run_steps([Step(step.name, mock.Mock(), step.requires) for step in steps]) == {}
+
+
+@pytest.fixture
+def tigera_steps(harness, charm):
+    harness.disable_hooks()
+    harness.update_config({"bgp_parameters": TEST_CONFIGURE_BGP_INPUT, "addons": True})
+    with mock.patch.object(CalicoEnterpriseCharm, "tigera_version", "3.16.1"):
+        yield lambda: {
+            step.name: step for step in charm.tigera_steps(RegistrySecret("user", "pass"))
+        }
+
+
+def test_tigera_steps_inputs(harness, tigera_steps):
+    before = tigera_steps()
+    harness.update_config({"addons_storage_class": "ceph-xfs"})
+    after = tigera_steps()
+    stale = [name for name in before if before[name].digest != after[name].digest]
+    assert stale == ["addons", "tigera-ready"]
+
+
+@pytest.mark.parametrize(
+    "errors, expected",
+    [
+        (
+            {
+                "operator": StepIncompleteError(WaitingStatus("waiting")),
+                "license": ValueError("bad license"),
+                "addons": ValueError("bad addons"),
+            },
+            BlockedStatus("Failed steps license, addons: see debug logs"),
+        ),
+        (
+            {
+                "tigera-ready": StepIncompleteError(BlockedStatus("not ready")),
+                "addons": StepIncompleteError(WaitingStatus("waiting")),
+            },
+            BlockedStatus("not ready"),
+        ),
+    ],
+    ids=["failed", "incomplete"],
+)
+def test_steps_status(charm, errors, expected):
+    assert charm.steps_status(errors) == expected
+
+
+def test_record_step_results(charm):
+    charm.stored.applied_digests = {"namespaces": "abc"}
+    charm.record_step_results(
+        {
+            "namespaces": None,
+            "license": {"applied_digests": {"license": "def"}},
+            "operator": {"operator_digests": {"Namespace/tigera-operator": "ghi"}},
+        }
+    )
+    assert charm.stored.applied_digests == {"namespaces": "abc", "license": "def"}
+    assert charm.stored.operator_digests == {"Namespace/tigera-operator": "ghi"}
+
+
+def test_steps_status_kube_unavailable(charm):
+    with pytest.raises(KubeUnavailableError):
+        charm.steps_status(
+            {
+                "tigera-ready": StepIncompleteError(WaitingStatus("waiting")),
+                "license": KubeUnavailableError("refused"),
+            }
+        )
+
+
+def test_update_status_retries_incomplete_reconcile(harness, charm):
+    harness.disable_hooks()
+    charm.stored.reconcile_pending = True
+    with mock.patch.object(charm, "on_config_changed") as on_config_changed:
+        # only the leader reconciles
+        charm.on_update_status(None)
+        on_config_changed.assert_not_called()
+        harness.set_leader(True)
+        charm.on_update_status(None)
+        on_config_changed.assert_called_once_with(None)
+
+
+@pytest.fixture
+def leader(harness, charm, kubeconfig, launch):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    harness.update_config(
+        {
+            "bgp_parameters": TEST_CONFIGURE_BGP_INPUT,
+            "image_registry": "registry.local",
+            "image_registry_secret": "user:pass",
+            "license": b64encode(b"license").decode(),
+            "nic_autodetection_regex": "eth0",
+            "pod_cidr": "192.168.10.0/24",
+            "stable_ip_cidr": "192.168.1.0/24",
+        }
+    )
+    cni_id = harness.add_relation("cni", "kubernetes-control-plane")
+    harness.add_relation_unit(cni_id, "kubernetes-control-plane/0")
+    harness.update_relation_data(cni_id, "kubernetes-control-plane/0", {"kubeconfig-hash": "1"})
+    peer_id = charm.model.relations["calico-enterprise"][0].id
+    harness.update_relation_data(peer_id, charm.app.name, {"service-cidr": DEFAULT_SERVICE_CIDR})
+    return charm
+
+
+def test_update_status_retries_after_kube_unavailable(leader, kube, launch):
+    kube.apply_all.side_effect = KubeUnavailableError("Kubernetes API unavailable: refused")
+    leader.on_config_changed(None)
+    assert leader.unit.status == WaitingStatus("Kubernetes API unavailable: see debug logs")
+    assert leader.stored.reconcile_pending
+    launch.assert_not_called()
+
+    # the API server is back; update-status reconciles again
+    kube.apply_all.side_effect = None
+    leader.on_update_status(None)
+    launch.assert_called_once()
+    assert leader.unit.status == WaitingStatus("Started operator in the background")
+    assert leader.stored.reconcile_pending
+
+
+def test_update_status_health_snapshot(harness, charm, kube):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    charm.stored.tigera_configured = True
+    calico = mock.Mock(status={"conditions": [{"type": "Progressing", "status": "True"}]})
+    calico.metadata.name = "calico"
+    kube.list.return_value = [calico]
+    charm.on_update_status(None)
+    assert charm.unit.status == WaitingStatus("Progressing: calico")
+    assert charm.app.status == WaitingStatus("Progressing: calico")
+    assert charm.peers.health.components == {"calico": ComponentHealth(PROGRESSING)}
+
+    # other units report the leader's snapshot without contacting the API server
+    harness.set_leader(False)
+    kube.reset_mock()
+    charm.on_update_status(None)
+    kube.list.assert_not_called()
+    assert charm.unit.status == WaitingStatus("Progressing: calico")
+
+    harness.set_leader(True)
+    calico.status["conditions"][0]["type"] = "Available"
+    with mock.patch.object(CalicoEnterpriseCharm, "tigera_version", "3.16.1"):
+        charm.on_update_status(None)
+    assert charm.unit.status == ActiveStatus("Ready")
+    assert charm.app.status == ActiveStatus("3.16.1")
+
+
+def test_update_status_probe_schedule(harness, charm, kube):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    charm.stored.tigera_configured = True
+    calico = mock.Mock(status={"conditions": [{"type": "Available", "status": "True"}]})
+    calico.metadata.name = "calico"
+    kube.list.return_value = [calico]
+    intervals = []
+    with mock.patch("time.time") as mock_time:
+        for now in range(0, 7200, 300):
+            mock_time.return_value = float(now)
+            charm.on_update_status(None)
+            intervals.append(charm.stored.probe_interval)
+    # healthy probes back off to the heartbeat, with cheap checks in between
+    assert intervals[:9] == [0, 300, 600, 600, 1200, 1200, 1200, 1200, 1800]
+    assert max(intervals) == charm_module.PROBE_MAX_INTERVAL
+    assert kube.list.call_count < len(intervals) / 2
+    assert charm.unit.status == ActiveStatus("Ready")
+
+    # a degradation probes on every update-status
+    calico.status["conditions"][0]["type"] = "Degraded"
+    charm.stored.probe_at = 0.0
+    charm.on_update_status(None)
+    assert charm.stored.probe_interval == 0
+
+    # so does a config change
+    charm.stored.probe_interval = 1200
+    charm.on_config_changed(None)
+    assert (charm.stored.probe_interval, charm.stored.probe_at) == (0, 0.0)
+
+
+@mock.patch("charm.time.time")
+def test_bgp_parameters_changed_coalesced(mock_time, harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    harness.update_config({"bgp_parameters": TEST_CONFIGURE_BGP_INPUT})
+    fingerprint = charm.peers.bgp_layout.fingerprint
+    with mock.patch.object(charm, "on_config_changed") as on_config_changed:
+        # the first change after a quiet period applies at once
+        mock_time.return_value = 1000.0
+        charm.on_bgp_parameters_changed(None)
+        on_config_changed.assert_called_once()
+        assert charm.stored.layout_seen == fingerprint
+
+        # further changes within the settle window wait for update-status
+        on_config_changed.reset_mock()
+        mock_time.return_value = 1010.0
+        charm.on_bgp_parameters_changed(None)
+        on_config_changed.assert_not_called()
+        assert charm.stored.layout_pending
+
+        mock_time.return_value = 1100.0
+        charm.on_update_status(None)
+        on_config_changed.assert_called_once()
+
+        # an applied layout is never reconciled again
+        on_config_changed.reset_mock()
+        charm.stored.applied_layout = fingerprint
+        charm.on_bgp_parameters_changed(None)
+        on_config_changed.assert_not_called()
+        assert not charm.stored.layout_pending
+
+
+@pytest.mark.parametrize("leader", [True, False])
+def test_cni_to_calico_enterprise(harness, charm, leader):
+    harness.disable_hooks()
+    harness.set_leader(leader)
+    cni_id = harness.add_relation("cni", "kubernetes-control-plane")
+    harness.add_relation_unit(cni_id, "kubernetes-control-plane/0")
+    harness.update_relation_data(
+        cni_id, "kubernetes-control-plane/0", {"service-cidr": DEFAULT_SERVICE_CIDR}
+    )
+    event = mock.Mock(relation=charm.model.get_relation("cni", cni_id))
+    event.unit = charm.model.get_unit("kubernetes-control-plane/0")
+    charm.cni_to_calico_enterprise(event)
+
+    peer_id = charm.model.relations["calico-enterprise"][0].id
+    app_data = harness.get_relation_data(peer_id, charm.app.name)
+    unit_data = harness.get_relation_data(peer_id, charm.unit.name)
+    assert ("service-cidr" in app_data) is leader
+    assert ("service-cidr" in unit_data) is not leader
+    assert charm.peers.service_cidr == DEFAULT_SERVICE_CIDR
+
+
+@mock.patch("charm.run_steps", autospec=True, return_value={})
+@mock.patch.object(CalicoEnterpriseCharm, "tigera_steps", autospec=True, return_value=[])
+@pytest.mark.usefixtures("kubeconfig")
+def test_leader_resumes_applied_state(tigera_steps, run_steps, harness, charm):
+    harness.disable_hooks()
+    harness.update_config(
+        {
+            "bgp_parameters": TEST_CONFIGURE_BGP_INPUT,
+            "license": b64encode(b"license").decode(),
+            "image_registry_secret": "user:pass",
+            "nic_autodetection_regex": "eth0",
+            "pod_cidr": "192.168.10.0/24",
+            "stable_ip_cidr": "192.168.1.0/24",
+        }
+    )
+    cni_id = harness.add_relation("cni", "kubernetes-control-plane")
+    harness.add_relation_unit(cni_id, "kubernetes-control-plane/0")
+    harness.update_relation_data(cni_id, "kubernetes-control-plane/0", {"kubeconfig-hash": "1"})
+    peer_id = charm.model.relations["calico-enterprise"][0].id
+    harness.set_leader(True)
+    harness.update_relation_data(
+        peer_id,
+        charm.app.name,
+        {
+            "service-cidr": DEFAULT_SERVICE_CIDR,
+            "applied-state": json.dumps(
+                {"step_digests": {"operator": "abc"}, "applied_version": "3.16.1"}
+            ),
+        },
+    )
+    harness.update_config({"image_registry": "registry.local"})
+
+    charm.on_config_changed(None)
+    assert charm.unit.status == ActiveStatus("Node Configured")
+    (_, digests), _ = run_steps.call_args
+    assert dict(digests) == {"operator": "abc"}
+    assert charm.unit.status == ActiveStatus("Node Configured")
+    state = json.loads(harness.get_relation_data(peer_id, charm.app.name)["applied-state"])
+    assert state["applied_version"] == "3.16.1"
+    assert state["applied_layout"] == charm.peers.bgp_layout.fingerprint
+
+
+@pytest.mark.usefixtures("kubeconfig")
+def test_non_leader_configured_by_published_cni_data(harness, charm):
+    harness.disable_hooks()
+    harness.update_config(
+        {
+            "bgp_parameters": TEST_CONFIGURE_BGP_INPUT,
+            "image_registry": "registry.local",
+            "image_registry_secret": "user:pass",
+            "license": b64encode(b"license").decode(),
+            "nic_autodetection_regex": "eth0",
+            "pod_cidr": "192.168.10.0/24",
+            "stable_ip_cidr": "192.168.1.0/24",
+        }
+    )
+    cni_id = harness.add_relation("cni", "kubernetes-control-plane")
+    harness.add_relation_unit(cni_id, "kubernetes-control-plane/0")
+    harness.update_relation_data(cni_id, "kubernetes-control-plane/0", {"kubeconfig-hash": "1"})
+    charm.on_config_changed(None)
+    assert charm.unit.status == WaitingStatus("Waiting for CNI relation")
+
+    # the leader publishes the cni data in the application databag
+    harness.enable_hooks()
+    peer_id = charm.model.relations["calico-enterprise"][0].id
+    harness.update_relation_data(
+        peer_id, charm.app.name, {"service-cidr": DEFAULT_SERVICE_CIDR, "cni-version": "1"}
+    )
+    assert charm.unit.status == ActiveStatus("Node Configured")
+    assert charm.stored.tigera_configured
+
+
+def test_label_nodes_retried(charm, kube):
+    response = mock.MagicMock(spec=httpx.Response)
+    response.json.return_value = {"code": 404, "message": "not found"}
+    kube.patch.side_effect = ApiError(request=mock.MagicMock(), response=response)
+    racks = {"node-1": "rack-1"}
+    digests = {}
+    step = Step("node-labels", lambda: charm.label_nodes(racks), inputs=racks)
+    errors = run_steps([step], digests)
+    assert errors["node-labels"].status == WaitingStatus("Waiting to label nodes: node-1")
+    assert "node-labels" not in digests
+
+    # the node appears; the next reconcile labels it
+    kube.patch.side_effect = None
+    assert run_steps([step], digests) == {}
+    assert kube.patch.call_count == 2
+    assert "node-labels" in digests
+
+
+def test_update_status_retries_node_labels(leader, kube):
+    response = mock.MagicMock(spec=httpx.Response)
+    response.json.return_value = {"code": 404, "message": "not found"}
+    kube.patch.side_effect = ApiError(request=mock.MagicMock(), response=response)
+    leader.on_config_changed(None)
+    assert leader.unit.status == WaitingStatus("Waiting to label nodes: test")
+    assert "node-labels" not in leader.stored.step_digests
+
+    # the node registers; update-status labels it
+    kube.patch.side_effect = None
+    leader.on_update_status(None)
+    kube.patch.assert_called_with(
+        charm_module.Node, "test", {"metadata": {"labels": {"rack": "r"}}}
+    )
+    assert "node-labels" in leader.stored.step_digests
+
+
+def test_layout_pending_cleared_after_losing_leadership(harness, charm):
+    harness.disable_hooks()
+    charm.stored.layout_pending = True
+    with mock.patch.object(charm, "on_config_changed") as on_config_changed:
+        for _ in range(3):
+            charm.on_update_status(None)
+    on_config_changed.assert_called_once_with(None)
+    assert not charm.stored.layout_pending
@@ -0,0 +1,83 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import unittest.mock as mock
+
+import pytest
+from health import (
+    AVAILABLE,
+    DEGRADED,
+    PROGRESSING,
+    STALE_AFTER,
+    UNKNOWN,
+    ComponentHealth,
+    HealthSnapshot,
+    unit_status,
+)
+from ops.model import ActiveStatus, WaitingStatus
+
+
+@pytest.mark.parametrize(
+    "conditions, expected",
+    [
+        ([], ComponentHealth(UNKNOWN)),
+        (
+            [
+                {
+                    "type": "Available",
+                    "status": "True",
+                    "lastTransitionTime": "1970-01-01T00:01:00Z",
+                },
+                {"type": "Progressing", "status": "False"},
+            ],
+            ComponentHealth(AVAILABLE, 60.0),
+        ),
+        (
+            [
+                {"type": "Available", "status": "True"},
+                {"type": "Progressing", "status": "True", "reason": "ResourceNotReady"},
+                {"type": "Degraded", "status": "True", "message": "Pods not ready: 2/3"},
+            ],
+            ComponentHealth(DEGRADED, None, "Pods not ready: 2/3"),
+        ),
+    ],
+)
+def test_component_from_conditions(conditions, expected):
+    assert ComponentHealth.from_conditions(conditions) == expected
+
+
+def test_snapshot_round_trip():
+    snapshot = HealthSnapshot({"calico": ComponentHealth(DEGRADED, 60.0, "Pods not ready")}, 1.0)
+    assert HealthSnapshot.from_json(snapshot.to_json()) == snapshot
+
+
+@mock.patch("health.time.time", return_value=4000.0)
+def test_snapshot_status(_time):
+    assert HealthSnapshot().status == WaitingStatus("Waiting for TigeraStatus components")
+    snapshot = HealthSnapshot(
+        {
+            "apiserver": ComponentHealth(PROGRESSING, 3940.0, "ResourceNotReady"),
+            "calico": ComponentHealth(DEGRADED, 400.0, "Pods not ready: 2/3"),
+            "compliance": ComponentHealth(DEGRADED),
+            "typha": ComponentHealth(AVAILABLE, 0.0),
+        }
+    )
+    assert snapshot.status == WaitingStatus(
+        "Degraded: calico for 1h (Pods not ready: 2/3), compliance; "
+        "Progressing: apiserver for 1m (ResourceNotReady)"
+    )
+    snapshot.components = {"typha": ComponentHealth(AVAILABLE, 0.0)}
+    assert snapshot.status == ActiveStatus("Ready")
+
+
+@mock.patch("health.time.time", return_value=1000.0 + STALE_AFTER + 1)
+def test_unit_status(_time):
+    assert unit_status(None) == WaitingStatus("Waiting for the leader's health snapshot")
+    snapshot = HealthSnapshot({"calico": ComponentHealth(AVAILABLE)}, 1000.0)
+    assert unit_status(snapshot) == WaitingStatus(
+        f"Leader's health snapshot is stale ({STALE_AFTER + 1}s old)"
+    )
+    snapshot.taken = 2000.0
+    assert unit_status(snapshot) == ActiveStatus("Ready")
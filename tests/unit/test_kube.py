@@ -0,0 +1,195 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import threading
+import unittest.mock as mock
+
+import httpx
+import pytest
+from kube import BREAKER_THRESHOLD, FIELD_MANAGER, KubeClient, KubeUnavailableError
+from lightkube.core.exceptions import ApiError, LoadResourceError
+from lightkube.models.apiextensions_v1 import (
+    CustomResourceDefinitionCondition,
+    CustomResourceDefinitionStatus,
+)
+from lightkube.models.core_v1 import PodCondition, PodStatus
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.apiextensions_v1 import CustomResourceDefinition
+from lightkube.resources.core_v1 import Namespace, Pod
+
+NAMESPACE_YAML = """
+apiVersion: v1
+kind: Namespace
+metadata:
+  name: tigera-operator
+---
+apiVersion: operator.tigera.io/v1
+kind: Installation
+metadata:
+  name: default
+""".strip()
+
+
+@pytest.fixture
+def lightkube_client():
+    with mock.patch("kube.Client", autospec=True) as mocked:
+        yield mocked
+
+
+@pytest.fixture
+def kube_config():
+    with mock.patch("kube.KubeConfig", autospec=True) as mocked:
+        yield mocked
+
+
+@pytest.fixture
+def kube(lightkube_client, kube_config):
+    yield KubeClient("/root/.kube/config")
+
+
+def api_error(code: int) -> ApiError:
+    response = mock.MagicMock(spec=httpx.Response)
+    response.json.return_value = {"code": code, "message": "failed"}
+    return ApiError(request=mock.MagicMock(), response=response)
+
+
+def test_client_is_pooled(kube, lightkube_client, kube_config):
+    assert kube.client is kube.client
+    kube_config.from_file.assert_called_once_with(kube.kubeconfig)
+    lightkube_client.assert_called_once_with(
+        config=kube_config.from_file.return_value, field_manager=FIELD_MANAGER
+    )
+
+
+@mock.patch("kube.load_all_yaml")
+@mock.patch("kube.load_in_cluster_generic_resources")
+def test_load_objects_discovers_once(mock_load_in_cluster, mock_load_all_yaml, kube):
+    mock_load_all_yaml.side_effect = [LoadResourceError("unknown"), ["obj"], ["obj"]]
+    assert kube.load_objects(NAMESPACE_YAML) == ["obj"]
+    assert kube.load_objects(NAMESPACE_YAML) == ["obj"]
+    mock_load_in_cluster.assert_called_once_with(kube.client)
+
+
+def test_apply_forces_ownership(kube):
+    ns = Namespace(metadata=ObjectMeta(name="tigera-operator"))
+    kube.apply(ns, field_manager="manager")
+    kube.client.apply.assert_called_once_with(
+        ns, namespace=None, field_manager="manager", force=True
+    )
+
+
+def _pod(name, ready):
+    return Pod(
+        metadata=ObjectMeta(name=name),
+        status=PodStatus(conditions=[PodCondition(type="Ready", status=str(ready))]),
+    )
+
+
+def _all_ready(pods):
+    return bool(pods) and all(pod.status.conditions[0].status == "True" for pod in pods)
+
+
+def test_wait_for_condition_met(kube):
+    kube.client.watch.return_value = iter(
+        [
+            ("ADDED", _pod("a", False)),
+            ("ADDED", _pod("b", True)),
+            ("DELETED", _pod("a", False)),
+        ]
+    )
+    assert kube.wait_for(Pod, _all_ready, 5, namespace="ns", labels={"app": "x"})
+    kube.client.watch.assert_called_once_with(
+        Pod, namespace="ns", labels={"app": "x"}, fields=None
+    )
+
+
+def test_wait_for_timeout(kube):
+    def _stalled(*_args, **_kwargs):
+        yield ("ADDED", _pod("a", False))
+        threading.Event().wait()
+
+    kube.client.watch.side_effect = _stalled
+    assert not kube.wait_for(Pod, _all_ready, 0.1)
+
+
+def test_wait_for_raises_watch_errors(kube):
+    kube.client.watch.side_effect = httpx.ConnectError("refused")
+    with pytest.raises(KubeUnavailableError):
+        kube.wait_for(Pod, _all_ready, 5)
+
+    kube.client.watch.side_effect = api_error(403)
+    with pytest.raises(ApiError):
+        kube.wait_for(Pod, _all_ready, 5)
+
+
+def _crd(name, established):
+    return CustomResourceDefinition(
+        metadata=ObjectMeta(name=name),
+        spec=mock.MagicMock(),
+        status=CustomResourceDefinitionStatus(
+            acceptedNames=mock.MagicMock(),
+            storedVersions=["v1"],
+            conditions=[
+                CustomResourceDefinitionCondition(type="Established", status=str(established))
+            ],
+        ),
+    )
+
+
+def test_wait_for_established(kube):
+    kube.client.watch.return_value = iter(
+        [
+            ("ADDED", _crd("a.example.com", True)),
+            ("ADDED", _crd("b.example.com", False)),
+            ("MODIFIED", _crd("b.example.com", True)),
+        ]
+    )
+    assert kube.wait_for_established(["a.example.com", "b.example.com"], 5)
+    kube.client.watch.assert_called_once_with(
+        CustomResourceDefinition, namespace=None, labels=None, fields=None
+    )
+
+
+@pytest.fixture
+def no_sleep():
+    with mock.patch("tenacity.nap.time.sleep") as mocked:
+        yield mocked
+
+
+def test_call_permanent_errors_are_not_retried(kube, no_sleep):
+    kube.client.apply.side_effect = api_error(422)
+    with pytest.raises(ApiError):
+        kube.apply(Namespace(metadata=ObjectMeta(name="x")))
+    assert kube.client.apply.call_count == 1
+    assert not kube.tripped
+
+
+def test_call_transient_errors_are_retried(kube, no_sleep):
+    kube.client.apply.side_effect = [api_error(503), httpx.ConnectError("refused"), "applied"]
+    assert kube.apply(Namespace(metadata=ObjectMeta(name="x"))) == "applied"
+    assert kube.client.apply.call_count == 3
+    assert not kube.tripped
+
+
+def test_call_breaker_trips(kube, no_sleep):
+    kube.client.apply.side_effect = httpx.ConnectError("refused")
+    with pytest.raises(KubeUnavailableError):
+        kube.apply(Namespace(metadata=ObjectMeta(name="x")))
+    assert kube.client.apply.call_count == BREAKER_THRESHOLD
+    assert kube.tripped
+
+    with pytest.raises(KubeUnavailableError):
+        kube.list(Pod)
+    kube.client.list.assert_not_called()
+
+
+def test_call_budget_exhausted(lightkube_client, kube_config):
+    kube = KubeClient("/root/.kube/config", budget=0)
+    with pytest.raises(KubeUnavailableError):
+        kube.list(Pod)
+    with pytest.raises(KubeUnavailableError):
+        kube.wait_for(Pod, _all_ready, 5)
+    kube.client.list.assert_not_called()
+    kube.client.watch.assert_not_called()
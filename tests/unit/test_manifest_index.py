@@ -0,0 +1,94 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import shutil
+from pathlib import Path
+
+import pytest
+import yaml
+from manifest_index import INDEX_FILE, ManifestIndex, build_index, main
+
+OPERATOR_YAML = """apiVersion: v1
+kind: Namespace
+metadata:
+  name: tigera-operator
+---
+# Source: crds/example.yaml
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: tigera-operator
+  namespace: tigera-operator
+"""
+
+CUSTOM_RESOURCES_YAML = """# A comment-only document
+---
+apiVersion: operator.tigera.io/v1
+kind: Installation
+metadata:
+  name: default
+"""
+
+
+@pytest.fixture
+def manifests(tmp_path):
+    (tmp_path / "tigera-operator.yaml").write_text(OPERATOR_YAML)
+    (tmp_path / "custom-resources.yaml").write_text(CUSTOM_RESOURCES_YAML)
+    yield tmp_path
+
+
+def test_build_index(manifests):
+    index = ManifestIndex(manifests, build_index(manifests))
+    assert [entry.key for entry in index.entries] == [
+        "Namespace/tigera-operator",
+        "Deployment/tigera-operator/tigera-operator",
+        "Installation/default",
+    ]
+    deployment = index.get("Deployment", "tigera-operator", "tigera-operator")
+    assert yaml.safe_load(index.read(deployment))["kind"] == "Deployment"
+    assert index.get("Deployment", "missing") is None
+
+
+def test_load_prebuilt_index(manifests):
+    assert main([str(manifests)]) == 0
+    assert (manifests / INDEX_FILE).exists()
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("manifest_index.build_index", None)
+        index = ManifestIndex.load(manifests)
+    assert len(index.entries) == 3
+
+
+def test_load_stale_index(manifests):
+    main([str(manifests)])
+    (manifests / "custom-resources.yaml").write_text(CUSTOM_RESOURCES_YAML + "spec: {}\n")
+    index = ManifestIndex.load(manifests)
+    installation = index.get("Installation", "default")
+    assert yaml.safe_load(index.read(installation))["spec"] == {}
+
+
+def test_load_index_stale_at_same_size(manifests):
+    main([str(manifests)])
+    (manifests / "custom-resources.yaml").write_text(
+        CUSTOM_RESOURCES_YAML.replace("default", "primary")
+    )
+    index = ManifestIndex.load(manifests)
+    assert index.get("Installation", "primary")
+
+
+def test_changed(manifests):
+    index = ManifestIndex.load(manifests)
+    applied = dict(index.digests)
+    assert index.changed(applied) == []
+    applied["Installation/default"] = "old"
+    assert [entry.key for entry in index.changed(applied)] == ["Installation/default"]
+
+
+def test_shipped_manifests(tmp_path):
+    version = (Path("upstream/ee") / "version").read_text()
+    shutil.copytree(Path("upstream/ee/manifests") / version, tmp_path / version)
+    index = ManifestIndex.load(tmp_path / version)
+    kinds = [entry.kind for entry in index.entries]
+    assert kinds.count("CustomResourceDefinition") == 64
+    assert index.get("Deployment", "tigera-operator", "tigera-operator")
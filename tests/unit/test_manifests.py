@@ -0,0 +1,151 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import unittest.mock as mock
+
+import httpx
+from lightkube.codecs import load_all_yaml
+from lightkube.core.exceptions import ApiError
+from lightkube.generic_resource import create_global_resource
+from manifests import apply_changed, apply_staged, digest, submit_group
+
+for kind, plural in [
+    ("LicenseKey", "licensekeys"),
+    ("BGPPeer", "bgppeers"),
+    ("BGPConfiguration", "bgpconfigurations"),
+]:
+    create_global_resource("crd.projectcalico.org", "v1", kind, plural)
+
+LICENSE_YAML = """
+apiVersion: crd.projectcalico.org/v1
+kind: LicenseKey
+metadata:
+  name: default
+spec:
+  token: abc
+""".strip()
+
+BGP_YAML = """
+apiVersion: crd.projectcalico.org/v1
+kind: BGPPeer
+metadata:
+  name: rack-1-10.0.0.1
+spec:
+  peerIP: 10.0.0.1
+---
+apiVersion: crd.projectcalico.org/v1
+kind: BGPConfiguration
+metadata:
+  name: default
+spec:
+  nodeToNodeMeshEnabled: false
+""".strip()
+
+NAMESPACE_YAML = """
+apiVersion: v1
+kind: Namespace
+metadata:
+  name: calico-system
+""".strip()
+
+
+def _load(text):
+    return load_all_yaml(text, create_resources_for_crds=True)
+
+
+def test_submit_group_dependency_order():
+    kube = mock.MagicMock()
+    objs = _load(BGP_YAML) + _load(LICENSE_YAML) + _load(NAMESPACE_YAML)
+    assert submit_group(kube, "cluster", objs) == {"cluster": digest(objs)}
+    (applied,), _ = kube.apply_all.call_args
+    assert [obj.kind for obj in applied] == [
+        "Namespace",
+        "LicenseKey",
+        "BGPConfiguration",
+        "BGPPeer",
+    ]
+
+
+def test_submit_group_skips_unchanged():
+    kube = mock.MagicMock()
+    applied = submit_group(kube, "license", _load(LICENSE_YAML))
+    kube.apply_all.assert_called_once()
+
+    kube.reset_mock()
+    assert submit_group(kube, "license", _load(LICENSE_YAML), applied) == {}
+    kube.apply_all.assert_not_called()
+
+    changed = submit_group(kube, "license", _load(LICENSE_YAML.replace("abc", "def")), applied)
+    assert changed and changed != applied
+    kube.apply_all.assert_called_once()
+
+
+def test_apply_changed_reports_each_object():
+    kube = mock.MagicMock()
+    response = mock.MagicMock(spec=httpx.Response)
+    response.json.return_value = {"code": 422, "message": "invalid"}
+    objs = _load(NAMESPACE_YAML) + _load(BGP_YAML)
+    kube.apply.side_effect = [None, ApiError(request=mock.MagicMock(), response=response), None]
+    report = apply_changed(kube, objs, field_manager="manager")
+    assert report.applied == ["Namespace/calico-system", "BGPPeer/rack-1-10.0.0.1"]
+    assert report.failed == {"BGPConfiguration/default": "invalid"}
+    assert set(report.digests) == set(report.applied)
+    kube.apply.assert_any_call(objs[0], field_manager="manager")
+
+    kube.reset_mock()
+    kube.apply.side_effect = None
+    report = apply_changed(kube, objs, report.digests, field_manager="manager")
+    assert report.applied == ["BGPConfiguration/default"]
+    assert report.unchanged == ["Namespace/calico-system", "BGPPeer/rack-1-10.0.0.1"]
+    assert kube.apply.call_count == 1
+
+
+CRD_YAML = """
+apiVersion: apiextensions.k8s.io/v1
+kind: CustomResourceDefinition
+metadata:
+  name: examples.example.com
+spec:
+  group: example.com
+  names:
+    kind: Example
+    plural: examples
+  scope: Cluster
+  versions:
+  - name: v1
+    served: true
+    storage: true
+---
+apiVersion: example.com/v1
+kind: Example
+metadata:
+  name: default
+""".strip()
+
+
+def test_apply_staged_waits_for_crds():
+    kube = mock.MagicMock()
+    kube.wait_for_established.return_value = True
+    report = apply_staged(kube, _load(CRD_YAML), 30, field_manager="manager")
+    assert report.applied == ["CustomResourceDefinition/examples.example.com", "Example/default"]
+    kube.wait_for_established.assert_called_once_with(["examples.example.com"], 30)
+    applied_kinds = [call.args[0].kind for call in kube.apply.call_args_list]
+    assert applied_kinds == ["CustomResourceDefinition", "Example"]
+
+
+def test_apply_staged_crds_not_established():
+    kube = mock.MagicMock()
+    kube.wait_for_established.return_value = False
+    report = apply_staged(kube, _load(CRD_YAML), 30)
+    assert report.applied == ["CustomResourceDefinition/examples.example.com"]
+    assert report.pending == ["Example/default"]
+    assert kube.apply.call_count == 1
+
+
+def test_apply_staged_without_new_crds():
+    kube = mock.MagicMock()
+    report = apply_staged(kube, _load(LICENSE_YAML), 30)
+    assert report.applied == ["LicenseKey/default"]
+    kube.wait_for_established.assert_not_called()
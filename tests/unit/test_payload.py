@@ -0,0 +1,50 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import json
+import unittest.mock as mock
+
+import payload
+import pytest
+
+
+@pytest.fixture
+def small_chunks():
+    with mock.patch("payload.INLINE_LIMIT", 64), mock.patch("payload.CHUNK_SIZE", 32):
+        yield
+
+
+@pytest.mark.usefixtures("small_chunks")
+def test_round_trip():
+    data = {}
+    small = json.dumps({"rack": "rack-1"})
+    payload.write(data, "key", small)
+    assert data == {"key": small}
+
+    large = json.dumps({"nodes": [f"node-{i}" for i in range(100)]})
+    payload.write(data, "key", large)
+    assert data["key"].startswith(payload.HEADER)
+    assert len(data) > 2
+    assert all(len(value) <= 32 for key, value in data.items() if key != "key")
+    assert payload.read(data, "key") == large
+
+    # chunks of the previous value are removed
+    payload.write(data, "key", small)
+    assert data == {"key": small}
+
+
+def test_read_plain_json():
+    assert payload.read({"key": '{"rack": "rack-1"}'}, "key") == '{"rack": "rack-1"}'
+    assert payload.read({}, "key") is None
+
+
+@pytest.mark.usefixtures("small_chunks")
+def test_read_corrupt():
+    data = {}
+    payload.write(data, "key", "x" * 1000)
+    data["key"] = data["key"].replace(data["key"].split(":")[1], "0" * 64)
+    assert payload.read(data, "key") is None
+    del data["key.0"]
+    assert payload.read(data, "key") is None
@@ -3,13 +3,18 @@
 #
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
+import json
 import unittest.mock as mock
 from ipaddress import ip_address
 from textwrap import indent
 
 import ops.testing
+import peer
 import pytest
+import yaml
 from charm import CalicoEnterpriseCharm
+from health import AVAILABLE, DEGRADED, HEARTBEAT, ComponentHealth, HealthSnapshot
+from peer import BGPLayout, BGPParameters
 
 
 def newline_indent(text: str, num_spaces: int) -> str:
@@ -114,7 +119,9 @@ def test_peer_relation_data(harness, charm, early_service, localhost_ips):
         "calico-enterprise/1",
         {"service-cidr": "172.22.134.0/24", "bgp-parameters": REMOTE_BGP_PARAMS},
     )
-    assert charm.peers.service_cidr is None
+    # units disagree, the value the leader published before stands
+    assert charm.peers.quorum_data("service-cidr") is None
+    assert charm.peers.service_cidr == "192.168.0.0/16"
     assert len(charm.peers.early_network_config["spec"]["nodes"]) == 2
 
     enc = charm.peers.bgp_layout_config_map["data"]["earlyNetworkConfiguration"]
@@ -191,3 +198,328 @@ def test_publish_bgp_parameters_json_passthru(harness, charm):
 
     for relation in charm.model.relations["calico-enterprise"]:
         assert relation.data[charm.model.unit]["bgp-parameters"] == expected
+
+
+BGP_PARAMETERS_TWO_NODE_REVERSED = f"""
+- {newline_indent(REMOTE_BGP_PARAMS,2)}
+- hostname: k8s-node-1
+  {newline_indent(LOCAL_BGP_PARAMS, 2)}
+""".strip()
+
+
+def test_canonical_rendering(harness, charm):
+    harness.disable_hooks()
+    harness.update_config({"bgp_parameters": BGP_PARAMETERS_TWO_NODE})
+    config_map = charm.peers.bgp_layout_config_map
+    peer_set = charm.peers.bgp_peer_set
+    fingerprint = charm.peers.bgp_layout.fingerprint
+
+    harness.update_config({"bgp_parameters": BGP_PARAMETERS_TWO_NODE_REVERSED})
+    assert charm.peers.bgp_layout_config_map == config_map
+    assert charm.peers.bgp_layout.fingerprint == fingerprint
+    assert charm.peers.bgp_peer_set == peer_set
+    assert [node.hostname for node in charm.peers.bgp_layout.nodes] == [
+        "k8s-node-1",
+        "k8s-node-2",
+    ]
+    assert [(_.rack, _.ip) for _ in peer_set] == [
+        ("rack-1", "192.168.1.254"),
+        ("rack-1", "192.168.2.254"),
+    ]
+
+
+def test_publish_bgp_parameters_write_if_changed(harness, charm, early_service, localhost_ips):
+    harness.disable_hooks()
+    relation = charm.model.relations["calico-enterprise"][0]
+    charm.peers.publish_bgp_parameters()
+    data = relation.data[charm.model.unit]
+    fingerprint = data["bgp-parameters-hash"]
+    assert charm.peers.unit_fingerprints() == {charm.model.unit.name: fingerprint}
+
+    early_service.side_effect = [
+        "\n--env CALICO_EARLY_NETWORKING=/magic.yaml \\\n",
+        f"spec:\n  nodes:\n  - {newline_indent(LOCAL_BGP_PARAMS, 4)}",
+    ]
+    with mock.patch.object(type(data), "__setitem__") as setitem:
+        charm.peers.publish_bgp_parameters()
+    setitem.assert_not_called()
+
+
+def test_peer_change_skips_unchanged_units(harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(
+        rel_id, "calico-enterprise/1", {"bgp-parameters": REMOTE_BGP_PARAMS}
+    )
+    with mock.patch.object(charm.peers, "publish_bgp_parameters"), mock.patch(
+        "ops.framework.BoundEvent.emit"
+    ) as emit:
+        charm.peers.peer_change(None)
+        assert emit.call_count == 1
+        charm.peers.peer_change(None)
+        assert emit.call_count == 1
+
+        harness.update_relation_data(
+            rel_id,
+            "calico-enterprise/1",
+            {"bgp-parameters": REMOTE_BGP_PARAMS.replace("20002", "20003")},
+        )
+        charm.peers.peer_change(None)
+        assert emit.call_count == 2
+
+
+def test_peer_change_published_layout(harness, charm):
+    harness.disable_hooks()
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(
+        rel_id, "calico-enterprise/1", {"bgp-parameters": REMOTE_BGP_PARAMS}
+    )
+    with mock.patch.object(charm.peers, "publish_bgp_parameters"), mock.patch.object(
+        charm.peers, "unit_fingerprints"
+    ) as unit_fingerprints, mock.patch.object(
+        charm.peers, "quorum_data"
+    ) as quorum_data, mock.patch(
+        "ops.framework.BoundEvent.emit"
+    ) as emit:
+        # units other than the leader wait for the layout it publishes
+        charm.peers.peer_change(None)
+        emit.assert_not_called()
+
+        harness.update_relation_data(
+            rel_id, charm.app.name, {"bgp-layout": "{}", "bgp-layout-hash": "abc"}
+        )
+        charm.peers.peer_change(None)
+        assert emit.call_count == 1
+        charm.peers.peer_change(None)
+        assert emit.call_count == 1
+
+        harness.update_relation_data(rel_id, charm.app.name, {"bgp-layout-hash": "def"})
+        charm.peers.peer_change(None)
+        assert emit.call_count == 2
+    unit_fingerprints.assert_not_called()
+    quorum_data.assert_not_called()
+
+
+def test_publish_cni_data(harness, charm):
+    harness.disable_hooks()
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(rel_id, "calico-enterprise/1", {"service-cidr": "10.0.0.0/24"})
+    assert charm.peers.service_cidr == "10.0.0.0/24"
+
+    charm.peers.publish_cni_data({"service-cidr": "10.1.0.0/24"})
+    app_data = harness.get_relation_data(rel_id, charm.app.name)
+    assert app_data == {}, "Only the leader publishes"
+
+    harness.set_leader(True)
+    charm.peers.publish_cni_data({"service-cidr": "10.1.0.0/24", "image-registry": None})
+    assert app_data == {"service-cidr": "10.1.0.0/24", "cni-version": "1"}
+    assert charm.peers.service_cidr == "10.1.0.0/24"
+
+    charm.peers.publish_cni_data({"service-cidr": "10.1.0.0/24"})
+    assert app_data["cni-version"] == "1"
+    charm.peers.publish_cni_data({"image-registry": "registry.local"})
+    assert app_data["cni-version"] == "2"
+
+
+def test_publish_missing_cni_data(harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(rel_id, "calico-enterprise/1", {"service-cidr": "10.0.0.0/24"})
+    app_data = harness.get_relation_data(rel_id, charm.app.name)
+    charm.peers.publish_missing_cni_data()
+    assert app_data == {"service-cidr": "10.0.0.0/24", "cni-version": "1"}
+
+    # the value from the cni relation outranks the units' stale agreement
+    charm.peers.publish_cni_data({"service-cidr": "10.9.0.0/24"})
+    with mock.patch.object(charm.peers, "publish_bgp_parameters"):
+        charm.peers.peer_change(None)
+    charm.peers.leader_elected(None)
+    assert app_data["service-cidr"] == "10.9.0.0/24"
+    assert app_data["cni-version"] == "2"
+
+
+def test_published_bgp_layout(harness, charm):
+    harness.disable_hooks()
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(
+        rel_id, "calico-enterprise/1", {"bgp-parameters": REMOTE_BGP_PARAMS}
+    )
+    app_data = harness.get_relation_data(rel_id, charm.app.name)
+    charm.peers.publish_bgp_layout()
+    assert app_data == {}, "Only the leader publishes"
+    assert charm.peers.bgp_layout_generation == 0
+
+    harness.set_leader(True)
+    charm.peers.publish_bgp_layout()
+    assert charm.peers.bgp_layout_generation == 1
+    layout = charm.peers.bgp_layout
+    assert app_data["bgp-layout-hash"] == layout.fingerprint
+    charm.peers.publish_bgp_layout()
+    assert charm.peers.bgp_layout_generation == 1
+
+    # other units read the published layout instead of each unit's parameters
+    harness.set_leader(False)
+    with mock.patch("peer.BGPParameters.parse_raw") as parse_raw:
+        assert charm.peers.bgp_layout == layout
+    parse_raw.assert_not_called()
+
+
+def test_bgp_layout_memoized(harness, charm):
+    harness.disable_hooks()
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(
+        rel_id, "calico-enterprise/1", {"bgp-parameters": REMOTE_BGP_PARAMS}
+    )
+    with mock.patch("peer.BGPParameters.parse_raw", wraps=BGPParameters.parse_raw) as parse:
+        layout = charm.peers.bgp_layout
+        assert charm.peers.bgp_layout is layout
+        assert charm.peers.early_network_config is charm.peers.early_network_config
+        assert charm.peers.bgp_peer_set is charm.peers.bgp_peer_set
+        assert parse.call_count == 1
+
+        # only the unit which changed is parsed again
+        harness.update_relation_data(
+            rel_id,
+            "calico-enterprise/1",
+            {"bgp-parameters": REMOTE_BGP_PARAMS.replace("20002", "20003")},
+        )
+        assert charm.peers.bgp_layout is not layout
+        assert charm.peers.bgp_layout.nodes[0].as_number == 20003
+        assert parse.call_count == 2
+
+    with mock.patch("peer.yaml.safe_load", wraps=yaml.safe_load) as safe_load:
+        harness.update_config({"bgp_parameters": "[]"})
+        charm.peers.bgp_layout
+        charm.peers.bgp_layout
+        assert safe_load.call_count == 1
+
+
+def test_publish_health(harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    app_data = harness.get_relation_data(rel_id, charm.app.name)
+    available = {"calico": ComponentHealth(AVAILABLE)}
+    charm.peers.publish_health(HealthSnapshot(available, 1000.0))
+    published = app_data["health"]
+    assert charm.peers.health.components == available
+
+    # an unchanged snapshot is only republished once the last is a heartbeat old
+    with mock.patch("health.time.time", return_value=1000.0 + HEARTBEAT - 1):
+        charm.peers.publish_health(HealthSnapshot(dict(available)))
+        assert app_data["health"] == published
+        degraded = {"calico": ComponentHealth(DEGRADED, 1000.0, "Pods not ready")}
+        charm.peers.publish_health(HealthSnapshot(degraded))
+        assert charm.peers.health.components == degraded
+
+
+def test_bgp_layout_indexes():
+    node = json.loads(REMOTE_BGP_PARAMS)
+    other = dict(node, hostname="k8s-node-3", stableAddress={"address": "10.10.10.3"})
+    other["peerings"] = node["peerings"][:1] + [{"peerASNumber": 21253, "peerIP": "192.168.1.253"}]
+    layout = BGPLayout(nodes=[node, other])
+    assert layout.by_hostname["k8s-node-3"].stable_address.address == "10.10.10.3"
+    assert layout.by_stable_address["10.10.10.2"].hostname == "k8s-node-2"
+    assert [n.hostname for n in layout.by_rack["rack-1"]] == ["k8s-node-2", "k8s-node-3"]
+    assert len(layout.by_asn[20002]) == 2
+    assert [peer.ip for peer in layout.rack_peers["rack-1"]] == [
+        "192.168.1.253",
+        "192.168.1.254",
+        "192.168.2.254",
+    ]
+    assert layout.index is layout.index
+    assert "index" not in layout.json()
+
+
+def test_published_bgp_layout_chunked(harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    harness.update_relation_data(
+        rel_id, "calico-enterprise/1", {"bgp-parameters": REMOTE_BGP_PARAMS}
+    )
+    with mock.patch("payload.INLINE_LIMIT", 64), mock.patch("payload.CHUNK_SIZE", 128):
+        charm.peers.publish_bgp_layout()
+        app_data = harness.get_relation_data(rel_id, charm.app.name)
+        assert app_data["bgp-layout"].startswith("zlib+base64:")
+        assert "bgp-layout.0" in app_data
+        layout = charm.peers.bgp_layout
+        harness.set_leader(False)
+        assert charm.peers.bgp_layout == layout
+
+
+def test_early_service_cfg_cached(tmp_path, localhost_ips):
+    early = tmp_path / "early.yaml"
+    other = LOCAL_BGP_PARAMS.replace("10.10.10.1", "10.10.10.9")
+    early.write_text(
+        "spec:\n  nodes:\n"
+        f"  - {newline_indent(other, 4)}\n"
+        f"  - {newline_indent(LOCAL_BGP_PARAMS, 4)}\n"
+        "  - {unparsed: [\n"
+    )
+    service = tmp_path / "calico-early.service"
+    service.write_text(f"--env CALICO_EARLY_NETWORKING={early} \\\n")
+    cache = tmp_path / "cache" / "early-network-node.json"
+    with mock.patch("peer.CALICO_EARLY_SERVICE", service), mock.patch(
+        "peer.EARLY_NETWORK_CACHE", cache
+    ), mock.patch("peer._read_file_content", wraps=peer._read_file_content) as read:
+        # parsing stops at the local node, before the malformed one
+        node = peer._early_service_cfg()
+        assert node.stable_address.address == "10.10.10.1"
+        assert read.call_count == 2
+
+        read.reset_mock()
+        assert peer._early_service_cfg() == node
+        read.assert_called_once_with(service)
+
+        early.write_text(f"spec:\n  nodes:\n  - {newline_indent(other, 4)}\n")
+        assert peer._early_service_cfg() is None
+
+
+def test_find_early_node_constructs_match_only():
+    other = LOCAL_BGP_PARAMS.replace("10.10.10.1", "10.10.10.9")
+    content = (
+        "spec:\n  nodes:\n"
+        f"  - {newline_indent(other, 4)}\n"
+        f"  - {newline_indent(LOCAL_BGP_PARAMS, 4)}\n"
+    )
+    with mock.patch.object(
+        yaml.SafeLoader,
+        "construct_document",
+        autospec=True,
+        side_effect=yaml.SafeLoader.construct_document,
+    ) as construct:
+        node = peer._find_early_node(content, "10.10.10.1")
+    assert node == yaml.safe_load(LOCAL_BGP_PARAMS)
+    construct.assert_called_once()
+
+
+def test_peer_change_cni_data(harness, charm):
+    harness.disable_hooks()
+    harness.set_leader(True)
+    rel_id = charm.model.relations["calico-enterprise"][0].id
+    harness.add_relation_unit(rel_id, "calico-enterprise/1")
+    with mock.patch.object(charm.peers, "publish_bgp_parameters"), mock.patch.object(
+        charm, "on_config_changed"
+    ) as on_config_changed:
+        charm.peers.peer_change(None)
+        on_config_changed.assert_not_called()
+
+        # cni data reaching a unit over the peer relation starts a reconcile
+        harness.update_relation_data(
+            rel_id, "calico-enterprise/1", {"service-cidr": "10.1.0.0/24"}
+        )
+        charm.peers.peer_change(None)
+        assert on_config_changed.call_count == 1
+        assert charm.peers.service_cidr == "10.1.0.0/24"
+        charm.peers.peer_change(None)
+        assert on_config_changed.call_count == 1
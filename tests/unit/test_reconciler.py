@@ -0,0 +1,112 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import threading
+
+import pytest
+from ops.model import WaitingStatus
+from reconciler import Step, StepIncompleteError, run_steps
+
+
+def test_run_steps_in_dependency_order():
+    order = []
+    steps = [
+        Step("c", lambda: order.append("c"), requires=("a", "b")),
+        Step("a", lambda: order.append("a")),
+        Step("b", lambda: order.append("b"), requires=("a",)),
+    ]
+    assert run_steps(steps) == {}
+    assert order == ["a", "b", "c"]
+
+
+def test_run_steps_concurrently():
+    # each step waits for the other, which only completes if both run at once
+    barrier = threading.Barrier(2, timeout=5)
+    steps = [Step("a", barrier.wait), Step("b", barrier.wait)]
+    assert run_steps(steps, workers=2) == {}
+
+
+def test_run_steps_skips_dependents_of_failures():
+    ran = []
+
+    def _fail():
+        raise StepIncompleteError(WaitingStatus("not yet"))
+
+    steps = [
+        Step("a", _fail),
+        Step("b", lambda: ran.append("b"), requires=("a",)),
+        Step("c", lambda: ran.append("c"), requires=("b",)),
+        Step("d", lambda: ran.append("d")),
+        Step("e", lambda: 1 / 0),
+    ]
+    errors = run_steps(steps)
+    assert list(errors) == ["a", "e"]
+    assert errors["a"].status == WaitingStatus("not yet")
+    assert isinstance(errors["e"], ZeroDivisionError)
+    assert ran == ["d"]
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [Step("a", lambda: None, requires=("missing",))],
+        [Step("a", lambda: None, requires=("b",)), Step("b", lambda: None, requires=("a",))],
+    ],
+    ids=["unknown", "circular"],
+)
+def test_run_steps_invalid_requirements(steps):
+    with pytest.raises(ValueError):
+        run_steps(steps)
+
+
+def test_run_steps_skips_unchanged_inputs():
+    ran = []
+    digests = {}
+
+    def _steps(storage_class):
+        return [
+            Step("operator", lambda: ran.append("operator"), inputs={"version": "3.16.1"}),
+            Step(
+                "addons",
+                lambda: ran.append("addons"),
+                requires=("operator",),
+                inputs={"storage_class": storage_class},
+            ),
+            Step("ready", lambda: ran.append("ready"), requires=("addons",)),
+        ]
+
+    assert run_steps(_steps("ceph-xfs"), digests) == {}
+    assert ran == ["operator", "addons", "ready"]
+    assert set(digests) == {"operator", "addons"}
+
+    ran.clear()
+    assert run_steps(_steps("ceph-xfs"), digests) == {}
+    assert ran == ["ready"]
+
+    ran.clear()
+    assert run_steps(_steps("ceph-ext4"), digests) == {}
+    assert ran == ["addons", "ready"]
+
+
+def test_run_steps_forgets_failed_inputs():
+    digests = {}
+    assert run_steps([Step("a", lambda: None, inputs={"x": 1})], digests) == {}
+    assert "a" in digests
+    assert list(run_steps([Step("a", lambda: 1 / 0, inputs={"x": 2})], digests)) == ["a"]
+    assert "a" not in digests
+
+
+def test_run_steps_results():
+    def _incomplete():
+        raise StepIncompleteError(WaitingStatus("not yet"), {"progress": 1})
+
+    results = {}
+    steps = [
+        Step("a", lambda: {"done": True}),
+        Step("b", _incomplete),
+        Step("c", lambda: 1 / 0),
+    ]
+    assert list(run_steps(steps, results=results)) == ["b", "c"]
+    assert results == {"a": {"done": True}, "b": {"progress": 1}, "c": None}
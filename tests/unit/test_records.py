@@ -0,0 +1,67 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import copy
+import json
+
+import pytest
+from peer import BGPLayout, BGPParameters, BGPPeerBinding
+from records import ValidationError
+
+NODE = {
+    "hostname": "k8s-node-1",
+    "asNumber": "64512",
+    "interfaceAddresses": ["192.168.1.1"],
+    "labels": {"rack": 1},
+    "peerings": [{"peerIP": "192.168.1.254", "peerASNumber": 65000}],
+    "stableAddress": {"address": "10.10.10.1"},
+    "unknown": "ignored",
+}
+
+
+def test_wire_format():
+    node = BGPParameters.parse_raw(json.dumps(NODE))
+    assert (node.as_number, node.labels.rack) == (64512, "1")
+    assert node.json(by_alias=True) == (
+        '{"asNumber": 64512, "interfaceAddresses": ["192.168.1.1"], "labels": {"rack": "1"}, '
+        '"peerings": [{"peerIP": "192.168.1.254", "peerASNumber": 65000}], '
+        '"stableAddress": {"address": "10.10.10.1"}, "hostname": "k8s-node-1"}'
+    )
+    assert node.dict()["stable_address"] == {"address": "10.10.10.1"}
+    assert BGPParameters.parse_raw(node.json(by_alias=True)) == node
+
+
+def test_dict_exclude():
+    layout = BGPLayout(nodes=[NODE, dict(NODE, hostname="k8s-node-0")])
+    rendered = layout.dict(by_alias=True, exclude={"nodes": {"__all__": {"hostname"}}})
+    assert [set(node) for node in rendered["nodes"]] == [set(NODE) - {"hostname", "unknown"}] * 2
+    assert [node.hostname for node in layout.nodes] == ["k8s-node-0", "k8s-node-1"]
+
+
+@pytest.mark.parametrize(
+    "raw, error",
+    [
+        ("not json", "invalid json"),
+        ("[]", "expected a mapping"),
+        (json.dumps(dict(NODE, asNumber="many")), "asNumber"),
+        (json.dumps({k: v for k, v in NODE.items() if k != "labels"}), "labels -> field required"),
+        (
+            json.dumps(dict(NODE, interfaceAddresses=["1.2.3.4", "nope"])),
+            "interfaceAddresses -> 1",
+        ),
+        (json.dumps(dict(NODE, peerings={"peerIP": "1.2.3.4"})), "not a valid list"),
+    ],
+)
+def test_validation_error(raw, error):
+    with pytest.raises(ValidationError, match=error):
+        BGPParameters.parse_raw(raw)
+
+
+def test_records_copy_and_compare():
+    binding = BGPPeerBinding(ip="192.168.1.254", asn=65000, rack="rack-1")
+    assert not hasattr(binding, "__dict__")
+    assert copy.copy(binding) == binding
+    assert len({binding, BGPPeerBinding(ip="192.168.1.254", asn="65000", rack="rack-1")}) == 1
+    assert binding != BGPPeerBinding(ip="192.168.1.253", asn=65000, rack="rack-1")
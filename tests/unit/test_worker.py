@@ -0,0 +1,134 @@
+# Copyright 2024 Canonical Ltd.
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import json
+import sys
+import unittest.mock as mock
+
+import pytest
+import worker
+from lightkube.resources.core_v1 import Pod
+from manifests import ApplyReport
+
+OPERATOR_YAML = """apiVersion: v1
+kind: Namespace
+metadata:
+  name: tigera-operator
+---
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: tigera-operator
+  namespace: tigera-operator
+"""
+
+
+@pytest.fixture
+def kube():
+    with mock.patch("worker.KubeClient", autospec=True) as mocked:
+        yield mocked.return_value
+
+
+@pytest.fixture
+def manifests(tmp_path):
+    (tmp_path / "tigera-operator.yaml").write_text(OPERATOR_YAML)
+    (tmp_path / "custom-resources.yaml").write_text("")
+    yield tmp_path
+
+
+@mock.patch("subprocess.check_call", autospec=True)
+def test_launch(check_call, worker_dir, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", "lib:src")
+    worker.launch("ready", {"rollout": "abc"})
+    (cmd,), _ = check_call.call_args
+    assert cmd[:3] == ["systemd-run", "--unit=calico-enterprise-ready", "--collect"]
+    assert cmd[-3:] == [sys.executable, worker.__file__, "ready"]
+    python_path = next(_ for _ in cmd if _.startswith("--setenv=PYTHONPATH="))
+    assert all(_.startswith("/") for _ in python_path.split("=", 2)[2].split(":"))
+    assert json.loads((worker_dir / "ready.request.json").read_text()) == {"rollout": "abc"}
+    job = worker.progress("ready")
+    assert job["state"] == worker.RUNNING
+    assert job["request"] == worker.request_digest({"rollout": "abc"})
+
+
+@mock.patch("subprocess.run", autospec=True)
+def test_is_running(run):
+    run.return_value.returncode = 0
+    assert worker.is_running("ready")
+    (cmd,), _ = run.call_args
+    assert cmd == ["systemctl", "is-active", "--quiet", "calico-enterprise-ready"]
+    run.return_value.returncode = 3
+    assert not worker.is_running("ready")
+
+
+def test_progress_missing():
+    assert worker.progress("ready") is None
+
+
+def test_main(worker_dir):
+    (worker_dir / "ready.request.json").write_text(json.dumps({"rollout": "abc"}))
+    digest = worker.request_digest({"rollout": "abc"})
+
+    def _task(request, progress):
+        progress("Halfway")
+        assert worker.progress("ready")["message"] == "Halfway"
+        return {"ready": True}
+
+    with mock.patch.dict(worker.TASKS, {"ready": _task}):
+        assert worker.main(["ready"]) == 0
+    job = worker.progress("ready")
+    assert job["request"] == digest
+    assert job["state"] == worker.DONE
+    assert job["result"] == {"ready": True}
+
+    with mock.patch.dict(worker.TASKS, {"ready": mock.Mock(side_effect=TimeoutError("late"))}):
+        assert worker.main(["ready"]) == 1
+    job = worker.progress("ready")
+    assert job["state"] == worker.FAILED
+    assert job["message"] == "late"
+
+
+@mock.patch("worker.apply_staged", autospec=True)
+def test_apply_operator(apply_staged, kube, manifests):
+    kube.load_objects.return_value = []
+    apply_staged.return_value = ApplyReport(
+        failed={"Deployment/tigera-operator/tigera-operator": "invalid"}
+    )
+    request = {
+        "kubeconfig": "/root/.kube/config",
+        "manifests": str(manifests),
+        "applied": {},
+        "crd_timeout": 120,
+        "field_manager": "calico-enterprise-operator",
+    }
+    result = worker.apply_operator(request, mock.Mock())
+    assert kube.load_objects.call_count == 2
+    assert list(result["digests"]) == ["Namespace/tigera-operator"]
+    assert result["failed"] == {"Deployment/tigera-operator/tigera-operator": "invalid"}
+
+    kube.reset_mock()
+    request["applied"] = {**result["digests"], "Deployment/tigera-operator/tigera-operator": ""}
+    worker.apply_operator(request, mock.Mock())
+    assert kube.load_objects.call_count == 1
+
+
+def test_wait_ready(kube):
+    request = {"kubeconfig": "/root/.kube/config", "timeout": 60}
+    kube.wait_for.side_effect = [True, True]
+    assert worker.wait_ready(request, mock.Mock()) == {}
+    _, args, kwargs = kube.wait_for.mock_calls[0]
+    assert args[0] is Pod
+    assert 0 < args[2] <= 60
+    assert kwargs["labels"] == {"k8s-app": "tigera-operator"}
+    _, args, kwargs = kube.wait_for.mock_calls[1]
+    assert args[0] is kube.resource.return_value
+    assert kwargs["fields"] == {"metadata.name": "calico"}
+
+    kube.wait_for.side_effect = [True, False]
+    with pytest.raises(TimeoutError, match="calico TigeraStatus"):
+        worker.wait_ready(request, mock.Mock())
+    kube.wait_for.side_effect = [False]
+    with pytest.raises(TimeoutError, match="tigera-operator POD"):
+        worker.wait_ready(request, mock.Mock())